@@ -4,26 +4,55 @@ import os
 from dotenv import load_dotenv
 import asyncio
 
-# --- load environment variables ---
-load_dotenv()
+# --- load environment variables (only if not already set, e.g. by the shell) ---
+if not os.environ.get("OPENAI_API_KEY"):
+    load_dotenv()
 
 
 async def main():
-    print("Mercari Agent Test Mode: Please input your request: ")
-    user_input = input("User: ")
-
     try:
         agent = MercariAgent(os.getenv("OPENAI_API_KEY"))
     except Exception as e:
         print(f"[Error] Failed to initialize MercariAgent: {e}")
         return
-    result = await agent.agent_respond(user_input)
-    print("\nAgent Output:")
-    message = result["message"]
+    # warm up connections while the user is typing
+    warmup = asyncio.create_task(agent.warmup())
+    try:
+        await respond(agent)
+    finally:
+        # never outlive the session, e.g. when input is interrupted
+        warmup.cancel()
+
+
+async def respond(agent: MercariAgent):
+    print("Mercari Agent Test Mode: Please input your request: ")
+    user_input = await asyncio.to_thread(input, "User: ")
+
+    streaming = False
+
+    def print_header():
+        print("\nAgent Output:")
+        print("--------------------------------")
+        print("### Message:")
+
+    result = None
+    async for chunk in agent.agent_respond_stream(user_input):
+        if isinstance(chunk, str):
+            # print the message as it is generated
+            if not streaming:
+                print_header()
+                streaming = True
+            print(chunk, end="", flush=True)
+        else:
+            result = chunk
+    if result is None:
+        print("[Error] The agent did not return a response.")
+        return
+    if not streaming:
+        print_header()
+        print(result["message"], end="")
     products = result["products"]
-    print("--------------------------------")
-    print("### Message:")
-    print(message)
+    print()
     print("--------------------------------")
     print("### Products:")
     print(products)
@@ -0,0 +1,194 @@
+import os
+import orjson
+import time
+import sqlite3
+import hashlib
+from array import array
+from typing import Optional, List, Tuple, Dict
+
+from src.agent.client import get_client
+from src.scraper.mercari_scraper import MercariItemDetail
+
+DEFAULT_CACHE_PATH = os.path.join("data", "agent_cache.sqlite3")
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+class ResponseCache:
+    """
+    Two-tier cache for agent responses, persisted in SQLite.
+    Tier 1 is an exact match on (model, normalized user input), tier 2 matches paraphrased
+    queries by embedding similarity. Entries expire after `ttl_hours` so prices stay fresh.
+    Deterministic LLM calls (e.g. the ranker) are cached in the same database by request hash,
+    and product name embeddings by (embedding model, name).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        ttl_hours: float = 6,
+        similarity_threshold: float = 0.93,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.ttl = ttl_hours * 3600
+        self.similarity_threshold = similarity_threshold
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        else:
+            path = ":memory:"
+        # autocommit, every put is written through so nothing is lost on a crash
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, created_at REAL, "
+            "embedding BLOB, message TEXT, products BLOB)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, created_at REAL, content TEXT)"
+        )
+        # embeddings don't change for a given text, so these never expire
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS name_embeddings ("
+            "model TEXT, name TEXT, embedding BLOB, PRIMARY KEY (model, name))"
+        )
+        self.prune()
+        # key -> float32 embedding, kept in memory so semantic lookups don't hit the disk
+        self.embeddings = {
+            key: array("f", blob)
+            for key, blob in self.db.execute(
+                "SELECT key, embedding FROM responses "
+                "WHERE model = ? AND embedding IS NOT NULL",
+                (model,),
+            )
+        }
+
+    def make_key(self, user_input: str) -> str:
+        normalized = user_input.strip().lower()
+        return hashlib.sha256(f"{self.model}\0{normalized}".encode("utf-8")).hexdigest()
+
+    async def lookup(
+        self, user_input: str
+    ) -> Tuple[Optional[dict], Optional[List[float]]]:
+        """
+        Return (cached result or None, embedding of user_input or None).
+        The embedding is returned on a miss so `put` doesn't have to compute it again.
+        """
+        self.prune()
+        result = self._get(self.make_key(user_input))
+        if result:
+            return result, None
+
+        embedding = await self.embed(user_input)
+        if embedding is None:
+            return None, None
+        best, best_score = None, 0.0
+        for key, cached in self.embeddings.items():
+            # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+            score = sum(a * b for a, b in zip(embedding, cached))
+            if score > best_score:
+                best, best_score = key, score
+        if best is not None and best_score > self.similarity_threshold:
+            return self._get(best), embedding
+        return None, embedding
+
+    def put(
+        self, user_input: str, result: dict, embedding: Optional[List[float]] = None
+    ):
+        key = self.make_key(user_input)
+        blob = array("f", embedding).tobytes() if embedding else None
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                self.model,
+                time.time(),
+                blob,
+                result["message"],
+                # orjson serializes the product dataclasses natively
+                orjson.dumps(result["products"]),
+            ),
+        )
+        if blob:
+            self.embeddings[key] = array("f", blob)
+
+    def get_completion(self, key: str) -> Optional[str]:
+        row = self.db.execute(
+            "SELECT content FROM completions WHERE key = ? AND created_at >= ?",
+            (key, time.time() - self.ttl),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_completion(self, key: str, content: str):
+        self.db.execute(
+            "INSERT OR REPLACE INTO completions VALUES (?, ?, ?)",
+            (key, time.time(), content),
+        )
+
+    def get_name_embeddings(self, names: List[str]) -> Dict[str, array]:
+        found = {}
+        # stay well below SQLite's bound parameter limit
+        for i in range(0, len(names), 500):
+            chunk = names[i : i + 500]
+            found.update(
+                (name, array("f", blob))
+                for name, blob in self.db.execute(
+                    "SELECT name, embedding FROM name_embeddings "
+                    f"WHERE model = ? AND name IN ({','.join('?' * len(chunk))})",
+                    (EMBEDDING_MODEL, *chunk),
+                )
+            )
+        return found
+
+    def put_name_embeddings(self, embeddings: Dict[str, List[float]]):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO name_embeddings VALUES (?, ?, ?)",
+            [
+                (EMBEDDING_MODEL, name, array("f", vector).tobytes())
+                for name, vector in embeddings.items()
+            ],
+        )
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        try:
+            response = await get_client(self.api_key).embeddings.create(
+                model=EMBEDDING_MODEL, input=text
+            )
+            return response.data[0].embedding
+        except Exception as e:
+            print(f"[Cache] Error computing embedding: {e}")
+            return None
+
+    def prune(self):
+        self.db.execute(
+            "DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        expired = [
+            key
+            for (key,) in self.db.execute(
+                "SELECT key FROM responses WHERE created_at < ?",
+                (time.time() - self.ttl,),
+            )
+        ]
+        if not expired:
+            return
+        self.db.executemany(
+            "DELETE FROM responses WHERE key = ?", [(k,) for k in expired]
+        )
+        for key in expired:
+            self.embeddings.pop(key, None)
+
+    def _get(self, key: str) -> Optional[dict]:
+        row = self.db.execute(
+            "SELECT message, products FROM responses WHERE key = ? AND created_at >= ?",
+            (key, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        message, products = row
+        return {
+            "message": message,
+            "products": [MercariItemDetail(**p) for p in orjson.loads(products)],
+        }
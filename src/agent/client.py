@@ -0,0 +1,27 @@
+import asyncio
+import weakref
+
+import httpx
+from openai import AsyncOpenAI
+
+# async clients hold connections tied to the event loop that opened them, so keep one set per loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(api_key: str) -> AsyncOpenAI:
+    """
+    Shared AsyncOpenAI client for `api_key` on the running event loop, so agents reuse pooled connections.
+    """
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=2,
+            timeout=60.0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            ),
+        )
+        clients[api_key] = client
+    return client
@@ -1,32 +1,87 @@
 import os
-import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import re
+import hashlib
+import orjson
+from openai import AsyncOpenAI
+from openai.types.responses import Response
+from openai.types.chat import ChatCompletion
 from src.scraper.mercari_scraper import (
-    search_mercari,
+    search_mercari_async,
     MercariItem,
     MercariItemDetail,
-    scrape_mercari_item,
+    scrape_mercari_item_async,
 )
 from enum import Enum
-from typing import TypedDict, List
+from typing import TypedDict, List, Optional, AsyncIterator, Union, Tuple, Callable
+from dataclasses import dataclass, field
+import heapq
 import asyncio
-from dataclasses import asdict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.agent.cache import ResponseCache, EMBEDDING_MODEL
+from src.agent.client import get_client
 
 
 class GPTModel(str, Enum):
     # better response quality
     GPT_4_1_MINI = "gpt-4.1-mini"
+    # cheaper and faster, good enough for picking item ids
     GPT_4_1_NANO = "gpt-4.1-nano"
 
 
+# number of products recommended when the model doesn't ask for a specific count
+DEFAULT_TOP_K = 3
+MAX_TOP_K = 5
+# model turns per request; the last one has to answer instead of calling another tool
+MAX_TURNS = 4
+# upper bound on detail pages scraped at once, keeps us clear of Mercari rate limiting
+MAX_CONCURRENT_SCRAPES = 10
+# candidates scraped speculatively while the reranker is picking
+PREFETCH_TOP_N = 5
+# completion budget per picked id for the ranker; Mercari ids plus JSON punctuation stay well under this
+RANKER_TOKENS_PER_ITEM = 16
+# below this many results the LLM ranker is used, embedding them isn't worth the extra call
+EMBEDDING_RERANK_MIN_ITEMS = 10
+# product name embeddings remembered per agent for the reranker
+NAME_EMBEDDING_CACHE_SIZE = 2048
+# routes requests sharing the static prompt prefix to the same OpenAI prompt cache
+PROMPT_CACHE_KEY = "mercari-agent"
+# inputs that can't be a shopping request, answered without calling the model
+TRIVIAL_INPUTS = {"?", ".", "hi", "hello"}
+TRIVIAL_INPUT_MESSAGE = "Please describe what you're looking for on Mercari."
+_WORD_RE = re.compile(r"\w")
+
+
 class AgentRespondResult(TypedDict):
     message: str
     products: List[MercariItemDetail]
 
 
-# --- load environment variables ---
-load_dotenv()
+@dataclass(slots=True)
+class AgentState:
+    top_products: List[MercariItemDetail] = field(default_factory=list)
+    items_by_id: dict = field(default_factory=dict)
+    # searches started while the response was still streaming, keyed by _search_key
+    searches: dict = field(default_factory=dict)
+    # embedding of the user input, if the response cache already computed it
+    query_embedding: Optional[List[float]] = None
+
+
+def _top_k(value) -> int:
+    """
+    top_k from the tool call, bounded to 1..MAX_TOP_K. The schema says so too, but the
+    model can still send e.g. -1, 2.5 or "3".
+    """
+    try:
+        top_k = int(value) if value else DEFAULT_TOP_K
+    except (TypeError, ValueError, OverflowError):
+        top_k = DEFAULT_TOP_K
+    return max(1, min(top_k, MAX_TOP_K))
+
+
+def _search_key(filters: dict) -> bytes:
+    return orjson.dumps(filters, option=orjson.OPT_SORT_KEYS)
+
 
 # --- Mercari search tool schema for OpenAI function calling ---
 mercari_search_tool = {
@@ -88,6 +143,12 @@ mercari_search_tool = {
                 },
                 "description": "Item condition: 1=新品・未使用, 2=未使用に近い, 3=目立った傷や汚れなし, 4=やや傷や汚れあり, 5=傷や汚れあり, 6=全体的に状態が悪い",
             },
+            "top_k": {
+                "type": "integer",
+                "minimum": 1,
+                "maximum": MAX_TOP_K,
+                "description": f"Number of products to recommend (default {DEFAULT_TOP_K}, max {MAX_TOP_K}). Only set if the user asks for a specific number.",
+            },
             # "itemTypes": {
             #     "type": "array",
             #     "items": {"type": "string"},
@@ -99,18 +160,10 @@ mercari_search_tool = {
     },
 }
 
+TOOLS = [mercari_search_tool]
 
-class MercariAgent:
-    def __init__(self, openai_api_key: str = None):
-        if openai_api_key is None:
-            openai_api_key = os.environ.get("OPENAI_API_KEY")
-        if not openai_api_key:
-            raise RuntimeError("OPENAI_API_KEY not set in environment.")
-        self.client = OpenAI(api_key=openai_api_key)
-        self.all_results = {}
-
-    async def agent_respond(self, user_input: str) -> AgentRespondResult:
-        system_prompt = """
+# --- system prompt for the shopping assistant ---
+SYSTEM_PROMPT = """
 You are a HIGHLY perfessional and helpful shopping assistant for MERCARI JAPAN. Your mission is to help users find the most suitable products on Mercari Japan based on their needs.
 You have access to the tool `mercari_search`, which you can use to search for products based on the user's request. The search keyword **must be translated into Japanese**, as the search results will be in Japanese.
 Your response to the user must always be in the same language as the user's input (e.g. if user types in English, reply in English; if user types in Chinese, reply in Chinese).
@@ -237,145 +290,629 @@ Follow this step-by-step chain of thoughts when handling any user request:
 `Let me know if you'd like me to look for a specific color or storage!`
 """
 
-        messages = [
-            {"role": "system", "content": system_prompt},
+# shared, never mutated: every request starts from the same system message object
+BASE_MESSAGES = ({"role": "system", "content": SYSTEM_PROMPT},)
+
+
+# --- prompt and structured output schema for the recommend_products ranker ---
+# kept free of per-request values (k goes in a user message) so the prefix is cacheable
+RECOMMEND_SYSTEM_PROMPT = (
+    "You are a helpful shopping assistant for Mercari Japan. "
+    "You will receive a list of products from Mercari and a user's shopping request. "
+    "Each product has an `id`, a name `n` and a price `p`. "
+    "Please pick the top products that best match the user's needs, and return their `id` in `item_ids`."
+)
+
+
+def recommend_products_format(k: int) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "recommended_products",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "item_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "minItems": 1,
+                        "maxItems": k,
+                        "description": "item_id of the recommended products, best match first",
+                    }
+                },
+                "required": ["item_ids"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+class MercariAgent:
+    def __init__(
+        self,
+        openai_api_key: str = None,
+        rerank: bool = False,
+        use_cache: bool = True,
+        prompt_cache_key: str = PROMPT_CACHE_KEY,
+    ):
+        if openai_api_key is None:
+            openai_api_key = os.environ.get("OPENAI_API_KEY")
+        if not openai_api_key:
+            raise RuntimeError("OPENAI_API_KEY not set in environment.")
+        self.api_key = openai_api_key
+        # rerank search results ourselves instead of trusting Mercari's ordering
+        self.rerank = rerank
+        self.prompt_cache_key = prompt_cache_key
+        self.cache = (
+            ResponseCache(openai_api_key, GPTModel.GPT_4_1_MINI.value)
+            if use_cache
+            else None
+        )
+        # dedicated pool so Selenium fallbacks aren't capped by (or starve) the default executor
+        self._scrape_executor = ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_SCRAPES, thread_name_prefix="mercari-scrape"
+        )
+        # product name -> embedding, LRU; names embed the same way on every request
+        self._name_embeddings = OrderedDict()
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        return get_client(self.api_key)
+
+    async def warmup(self):
+        """
+        Open a pooled connection to the OpenAI API ahead of the first request (e.g. while the user is typing).
+        """
+        try:
+            await self.client.models.retrieve(GPTModel.GPT_4_1_MINI.value)
+        except Exception as e:
+            print(f"[Agent] Warmup failed: {e}")
+
+    async def agent_respond(self, user_input: str) -> AgentRespondResult:
+        """
+        Respond to a shopping request. See `agent_respond_stream` to get the message as it is generated.
+        """
+        return await self._final(self.agent_respond_stream(user_input))
+
+    def agent_respond_sync(self, user_input: str) -> AgentRespondResult:
+        """
+        Blocking agent_respond for callers without an event loop.
+        """
+        return asyncio.run(self.agent_respond(user_input))
+
+    async def agent_respond_stream(
+        self, user_input: str
+    ) -> AsyncIterator[Union[str, AgentRespondResult]]:
+        """
+        Respond to a shopping request, yielding the message text chunk by chunk as it is generated
+        and finally the full AgentRespondResult.
+        """
+        trivial = self._trivial_response(user_input)
+        if trivial is not None:
+            yield trivial["message"]
+            yield trivial
+            return
+
+        embedding = None
+        if self.cache:
+            cached, embedding = await self.cache.lookup(user_input)
+            if cached is not None:
+                print("[Agent] Returning cached response.")
+                yield cached["message"]
+                yield cached
+                return
+        async for chunk in self._respond(user_input, embedding):
+            yield chunk
+
+    @staticmethod
+    def _trivial_response(user_input: str) -> Optional[AgentRespondResult]:
+        """
+        The canned reply for empty and trivial inputs, which aren't worth a model call.
+        """
+        query = user_input.strip()
+        if query.lower() in TRIVIAL_INPUTS or not _WORD_RE.search(query):
+            return {"message": TRIVIAL_INPUT_MESSAGE, "products": []}
+        return None
+
+    @staticmethod
+    async def _final(
+        chunks: AsyncIterator[Union[str, AgentRespondResult]],
+    ) -> AgentRespondResult:
+        async for chunk in chunks:
+            if not isinstance(chunk, str):
+                return chunk
+
+    async def agent_respond_batch(
+        self, user_inputs: List[str], poll_interval: float = 10
+    ) -> List[AgentRespondResult]:
+        """
+        Respond to many requests at once through the OpenAI Batch API (half the cost, up to 24h turnaround).
+        Only the first turn (picking the search filters) is batched, later turns depend on the scrape results.
+        Meant for evals and regression sweeps, not interactive use.
+        """
+        results = {}
+        embeddings = {}
+        bodies = {}
+        for user_input in user_inputs:
+            custom_id = hashlib.sha256(user_input.encode("utf-8")).hexdigest()
+            if custom_id in results or custom_id in bodies:
+                continue
+            trivial = self._trivial_response(user_input)
+            if trivial is not None:
+                results[custom_id] = trivial
+                continue
+            if self.cache:
+                cached, embeddings[custom_id] = await self.cache.lookup(user_input)
+                if cached is not None:
+                    results[custom_id] = cached
+                    continue
+            bodies[custom_id] = {
+                **self._request_body(self._build_messages(user_input)),
+                "prompt_cache_key": self.prompt_cache_key,
+            }
+
+        responses = await self._run_batch("/v1/responses", bodies, poll_interval)
+        for user_input in user_inputs:
+            custom_id = hashlib.sha256(user_input.encode("utf-8")).hexdigest()
+            if custom_id in results:
+                continue
+            body = responses.get(custom_id)
+            # requests that failed inside the batch fall back to a live call
+            response = Response.model_validate(body) if body else None
+            results[custom_id] = await self._final(
+                self._respond(user_input, embeddings.get(custom_id), response)
+            )
+        return [
+            results[hashlib.sha256(u.encode("utf-8")).hexdigest()] for u in user_inputs
+        ]
+
+    async def _run_batch(
+        self,
+        endpoint: str,
+        bodies: dict,
+        poll_interval: float = 10,
+        max_poll_interval: float = 300,
+    ) -> dict:
+        """
+        Submit request bodies (keyed by custom_id) as one OpenAI batch and wait for it to finish.
+        Returns the response bodies of the successful requests, keyed by custom_id.
+        """
+        if not bodies:
+            return {}
+        jsonl = b"\n".join(
+            orjson.dumps(
+                {"custom_id": cid, "method": "POST", "url": endpoint, "body": body}
+            )
+            for cid, body in bodies.items()
+        )
+        batch_file = await self.client.files.create(
+            file=("batch.jsonl", jsonl), purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id, endpoint=endpoint, completion_window="24h"
+        )
+        print(f"[Agent] Submitted batch {batch.id} with {len(bodies)} requests.")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"[Agent] Batch {batch.id} ended with status {batch.status}.")
+            return {}
+
+        results = {}
+        output_file = await self.client.files.content(batch.output_file_id)
+        for line in output_file.text.splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                print(f"[Agent] Batch request {record.get('custom_id')} failed.")
+                continue
+            results[record["custom_id"]] = response["body"]
+        return results
+
+    def _request_body(self, messages: list, final: bool = False) -> dict:
+        body = {
+            "model": GPTModel.GPT_4_1_MINI.value,
+            "input": messages,
+            "tools": TOOLS,
+        }
+        if final:
+            # tools stay in the request so the cached prompt prefix still matches
+            body["tool_choice"] = "none"
+        return body
+
+    def _build_messages(self, user_input: str) -> list:
+        return [
+            *BASE_MESSAGES,
             {
                 "role": "user",
                 "content": f"{user_input}. IMPORTANT: Translate the response in the same language as the user's input.",
             },
+            # sent once up front so every tool round re-sends the same prefix
+            {
+                "role": "system",
+                "content": f"IMPORTANT: The response should be in the same language as the user's input. Here is the user's input: {user_input}. Analyze the user's input and determine the language before responding.",
+            },
         ]
-        tools = [mercari_search_tool]
-
-        while True:
-            response = self.client.responses.create(
-                model=GPTModel.GPT_4_1_MINI,
-                input=[
-                    *messages,
-                    {
-                        "role": "system",
-                        "content": f"IMPORTANT: The response should be in the same language as the user's input. Here is the user's input: {user_input}. Analyze the user's input and determine the language before responding.",
-                    },
-                ],
-                tools=tools,
-            )
-            output = response.output[0]
-            # print(output)
-            if getattr(output, "type", None) == "function_call":
-                function_name = getattr(output, "name", None)
-                call_id = getattr(output, "call_id", None)
-                args = json.loads(getattr(output, "arguments", "{}"))
-                if function_name == "mercari_search":
-                    mercari_items = search_mercari(args)
-                    search_results = [
-                        {
-                            "name": item.name,
-                            "price": item.price,
-                            "image": item.image,
-                            "url": item.url,
-                            "item_id": item.item_id,
-                            "itemtype": item.itemtype,
-                        }
-                        for item in mercari_items
-                    ]
-                    self.all_results["search_results"] = search_results
-                    messages.append(output)
-                    top_products = self.recommend_products(
-                        user_input, search_results, GPTModel.GPT_4_1_MINI, 3
-                    )
 
-                    # Async get detailed product info
-                    async def async_scrape(item):
-                        try:
-                            if isinstance(item, dict):
-                                item_obj = MercariItem(
-                                    name=item.get("name"),
-                                    price=item.get("price"),
-                                    image=item.get("image"),
-                                    url=item.get("url"),
-                                    item_id=item.get("item_id"),
-                                    itemtype=item.get("itemtype"),
-                                )
-                            else:
-                                item_obj = item
-                            return await asyncio.to_thread(
-                                scrape_mercari_item, item_obj
-                            )
-                        except Exception as e:
-                            print(f"[Agent] Error scraping detail: {e}")
-                            return MercariItemDetail(
-                                name=item.get("name"),
-                                price=item.get("price"),
-                                image=item.get("image"),
-                                url=item.get("url"),
-                                item_id=item.get("item_id"),
-                                itemtype=item.get("itemtype"),
-                            )
+    async def _respond(
+        self,
+        user_input: str,
+        embedding: Optional[List[float]] = None,
+        response: Optional[Response] = None,
+    ) -> AsyncIterator[Union[str, AgentRespondResult]]:
+        """
+        Run the tool loop (at most MAX_TURNS model calls), yielding message deltas
+        and then the result.
+        `response` can carry an already computed first turn (e.g. from a batch).
+        """
+        messages = self._build_messages(user_input)
+        # per call, so concurrent requests on one agent don't clobber each other's results
+        state = AgentState(query_embedding=embedding)
+        tool_handlers = {"mercari_search": self._handle_mercari_search}
 
-                    detailed_products = await asyncio.gather(
+        try:
+            for turn in range(MAX_TURNS):
+                if response is None:
+                    # any turn may turn out to be the final answer, so stream them all
+                    async with self.client.responses.stream(
+                        **self._request_body(messages, final=turn == MAX_TURNS - 1),
+                        extra_body={"prompt_cache_key": self.prompt_cache_key},
+                    ) as stream:
+                        async for event in stream:
+                            if event.type == "response.output_text.delta":
+                                yield event.delta
+                            elif (
+                                event.type == "response.output_item.done"
+                                and event.item.type == "function_call"
+                                and event.item.name == "mercari_search"
+                            ):
+                                # search while the rest of the response streams in
+                                self._start_search(state, event.item.arguments)
+                        response = await stream.get_final_response()
+                calls = [
+                    output
+                    for output in response.output
+                    if output.type == "function_call"
+                ]
+                if calls:
+                    if any(call.name not in tool_handlers for call in calls):
+                        # unknown tool, break
+                        break
+                    # parallel tool calls (e.g. several searches) run concurrently
+                    state.top_products = []
+                    products = await asyncio.gather(
                         *[
-                            async_scrape(item)
-                            for item in top_products.get("products", [])
-                            if item
+                            tool_handlers[call.name](
+                                user_input, orjson.loads(call.arguments), state
+                            )
+                            for call in calls
                         ]
                     )
-                    messages.append(
-                        {
-                            "type": "function_call_output",
-                            "call_id": call_id,
-                            "output": json.dumps(
-                                [asdict(item) for item in detailed_products]
-                            ),
-                        }
-                    )
-                    self.all_results["top_products"] = detailed_products
+                    for call, call_products in zip(calls, products):
+                        messages.append(call)
+                        messages.append(
+                            {
+                                "type": "function_call_output",
+                                "call_id": call.call_id,
+                                # orjson serializes dataclasses natively, no asdict copies
+                                "output": orjson.dumps(call_products).decode(),
+                            }
+                        )
+                        # overlapping searches can return the same listing
+                        known = {product.item_id for product in state.top_products}
+                        state.top_products.extend(
+                            p for p in call_products if p.item_id not in known
+                        )
+                    response = None
                 else:
-                    # unknown tool, break
-                    break
-            else:
-                return {
-                    "message": response.output_text,
-                    "products": self.all_results.get("top_products", []),
-                    # "raw_results": self.all_results.get("search_results", []),
-                }
-
-    def recommend_products(
-        self, user_input: str, search_results: list, model: str, k: int = 3
+                    result = {
+                        "message": response.output_text,
+                        "products": state.top_products,
+                    }
+                    # only cache answers that actually recommend something
+                    if self.cache and result["products"]:
+                        self.cache.put(user_input, result, embedding)
+                    yield result
+                    return
+        finally:
+            # searches started for calls that never ran (unknown tool, error, early close)
+            for task in state.searches.values():
+                task.cancel()
+
+    async def _handle_mercari_search(
+        self, user_input: str, args: dict, state: AgentState
+    ) -> List[MercariItemDetail]:
+        """
+        Run mercari_search and scrape details for the top products.
+        """
+        top_k = _top_k(args.pop("top_k", None))
+        started = state.searches.pop(_search_key(args), None)
+        mercari_items = await (started or search_mercari_async(args))
+        # the ranker and the scraper share the search result dataclasses, no dict copies
+        state.items_by_id.update({item.item_id: item for item in mercari_items})
+
+        if self.rerank and len(mercari_items) > top_k:
+            # scrape the first candidates while the ranker is still running
+            prefetch = {
+                item.item_id: asyncio.ensure_future(
+                    self._scrape_detail(state, item.item_id)
+                )
+                for item in mercari_items[:PREFETCH_TOP_N]
+            }
+            try:
+                top_products = await self._rerank(
+                    user_input, mercari_items, top_k, state
+                )
+            except BaseException:
+                for task in prefetch.values():
+                    task.cancel()
+                raise
+            picked = {item.item_id for item in top_products}
+            for item_id, task in prefetch.items():
+                if item_id not in picked:
+                    task.cancel()
+            detailed_products = await asyncio.gather(
+                *[
+                    prefetch.get(item.item_id)
+                    or self._scrape_detail(state, item.item_id)
+                    for item in top_products
+                ]
+            )
+        else:
+            # search results already follow the sort/order the model picked,
+            # and there is nothing to rank when they all fit in top_k
+            detailed_products = await asyncio.gather(
+                *[
+                    self._scrape_detail(state, item.item_id)
+                    for item in mercari_items[:top_k]
+                ]
+            )
+
+        return detailed_products
+
+    async def _rerank(
+        self, user_input: str, items: List[MercariItem], k: int, state: AgentState
+    ) -> List[MercariItem]:
+        """
+        Pick the top k items by embedding similarity between the request and the product names.
+        Short result lists go to the LLM ranker instead.
+        """
+        if len(items) < EMBEDDING_RERANK_MIN_ITEMS:
+            return await self._llm_rerank(user_input, items, k)
+        names = [item.name or "N/A" for item in items]
+        # local copy, a concurrent request may evict names from the LRU while we await
+        vectors = {
+            name: self._name_embeddings[name]
+            for name in dict.fromkeys(names)
+            if name in self._name_embeddings
+        }
+        missing = [name for name in dict.fromkeys(names) if name not in vectors]
+        if missing and self.cache:
+            vectors.update(self.cache.get_name_embeddings(missing))
+            missing = [name for name in missing if name not in vectors]
+        query = state.query_embedding
+        inputs = missing if query else [user_input, *missing]
+        if inputs:
+            try:
+                response = await self.client.embeddings.create(
+                    model=EMBEDDING_MODEL, input=inputs
+                )
+            except Exception as e:
+                print(f"[Agent] Embedding rerank failed, using the LLM ranker: {e}")
+                return await self._llm_rerank(user_input, items, k)
+            embedded = [d.embedding for d in response.data]
+            if query is None:
+                query = embedded.pop(0)
+            fresh = dict(zip(missing, embedded))
+            vectors.update(fresh)
+            if self.cache and fresh:
+                self.cache.put_name_embeddings(fresh)
+
+        def score(i: int) -> float:
+            # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+            return sum(a * b for a, b in zip(query, vectors[names[i]]))
+
+        top = heapq.nlargest(k, range(len(items)), key=score)
+        for name, vector in vectors.items():
+            self._name_embeddings[name] = vector
+            self._name_embeddings.move_to_end(name)
+        while len(self._name_embeddings) > NAME_EMBEDDING_CACHE_SIZE:
+            self._name_embeddings.popitem(last=False)
+        return [items[i] for i in top]
+
+    async def _llm_rerank(
+        self, user_input: str, items: List[MercariItem], k: int
+    ) -> List[MercariItem]:
+        response = await self.recommend_products(
+            user_input, items, GPTModel.GPT_4_1_NANO, k
+        )
+        return response["products"]
+
+    @staticmethod
+    def _start_search(state: AgentState, arguments: str):
+        filters = orjson.loads(arguments)
+        filters.pop("top_k", None)
+        key = _search_key(filters)
+        if key not in state.searches:
+            state.searches[key] = asyncio.ensure_future(search_mercari_async(filters))
+
+    async def _scrape_detail(
+        self, state: AgentState, item_id: str
+    ) -> MercariItemDetail:
+        """
+        Look up the item details, falling back to the search result on errors.
+        """
+        item = state.items_by_id[item_id]
+        try:
+            return await scrape_mercari_item_async(item, self._scrape_executor)
+        except Exception as e:
+            print(f"[Agent] Error scraping detail: {e}")
+            return MercariItemDetail(
+                name=item.name,
+                price=item.price,
+                image=item.image,
+                url=item.url,
+                item_id=item.item_id,
+                itemtype=item.itemtype,
+            )
+
+    async def recommend_products(
+        self,
+        user_input: str,
+        search_results: List[MercariItem],
+        model: str,
+        k: int = 3,
     ) -> dict:
         """
-        Use LLM to pick and recommend the top 3 products from all search results, and return as a JSON list of item_id.
+        Use LLM to pick and recommend the top k products from all search results, returned as a structured list of item_id.
         """
-        system_prompt = (
-            "You are a helpful shopping assistant for Mercari Japan. "
-            "You will receive a list of products from Mercari and a user's shopping request. "
-            f"Please pick the top {k} products that best match the user's needs, and directly return a JSON list of their item_id (e.g. ['id1', 'id2', 'id3']). "
-            "Do not return any explanation, only the JSON list."
+        message = await self._cached_chat(
+            self._recommend_body(user_input, search_results, model, k),
+            validate=self._is_ranking,
         )
+        return self._pick_products(message, search_results, k)
+
+    async def recommend_products_batch(
+        self,
+        inputs: List[Tuple[str, List[MercariItem]]],
+        model: str = GPTModel.GPT_4_1_NANO,
+        k: int = DEFAULT_TOP_K,
+        poll_interval: float = 10,
+    ) -> List[dict]:
+        """
+        recommend_products for many (user_input, search_results) pairs through the OpenAI Batch API.
+        Meant for evals and bulk sessions; requests that fail in the batch are ranked live.
+        """
+        bodies = {
+            f"rank-{i}": self._recommend_body(user_input, search_results, model, k)
+            for i, (user_input, search_results) in enumerate(inputs)
+        }
+        cached = {}
+        if self.cache:
+            for custom_id, body in list(bodies.items()):
+                message = self.cache.get_completion(self._chat_key(body))
+                if message is not None:
+                    cached[custom_id] = message
+                    del bodies[custom_id]
+        responses = await self._run_batch("/v1/chat/completions", bodies, poll_interval)
+        results = []
+        for i, (user_input, search_results) in enumerate(inputs):
+            custom_id = f"rank-{i}"
+            message = cached.get(custom_id)
+            if message is None and responses.get(custom_id):
+                choice = ChatCompletion.model_validate(responses[custom_id]).choices[0]
+                message = choice.message.content
+                if self.cache and self._is_ranking(message, choice.finish_reason):
+                    key = self._chat_key(bodies[custom_id])
+                    self.cache.put_completion(key, message)
+            if message is not None:
+                results.append(self._pick_products(message, search_results, k))
+            else:
+                results.append(
+                    await self.recommend_products(user_input, search_results, model, k)
+                )
+        return results
+
+    def _recommend_body(
+        self, user_input: str, search_results: List[MercariItem], model: str, k: int
+    ) -> dict:
+        # the ranker only needs id, name and price; image urls etc. are just extra tokens
+        trimmed = [
+            {"id": item.item_id, "n": (item.name or "")[:80], "p": item.price}
+            for item in search_results
+        ]
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": RECOMMEND_SYSTEM_PROMPT},
             {"role": "user", "content": user_input},
             {
                 "role": "assistant",
                 "content": (
                     "Here are all the products from Mercari (in JSON):\n"
-                    f"{json.dumps(search_results, ensure_ascii=False)}"
+                    f"{orjson.dumps(trimmed).decode()}"
                 ),
             },
+            {"role": "user", "content": f"Pick the top {k} products."},
         ]
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=messages,
+        return {
+            "model": model,
+            "messages": messages,
+            "response_format": recommend_products_format(k),
+            # deterministic, so repeated rankings can be served from the cache
+            "temperature": 0,
+            # the schema fixes the output shape, so the reply is just the id list
+            "max_tokens": RANKER_TOKENS_PER_ITEM * (k + 1),
+        }
+
+    async def _cached_chat(
+        self, body: dict, validate: Optional[Callable[[str, str], bool]] = None
+    ) -> Optional[str]:
+        """
+        chat.completions.create returning the message content, cached by request hash
+        when the call is deterministic (temperature ~0). `validate(message, finish_reason)`
+        decides which replies are worth caching; by default only complete ones are.
+        """
+        cacheable = self.cache and body.get("temperature", 1) <= 0.01
+        if cacheable:
+            key = self._chat_key(body)
+            message = self.cache.get_completion(key)
+            if message is not None:
+                print("[Agent] Returning cached completion.")
+                return message
+        response = await self.client.chat.completions.create(**body)
+        choice = response.choices[0]
+        message = choice.message.content
+        # a cut off or refused reply would otherwise be served from the cache for the whole TTL
+        valid = (
+            validate(message, choice.finish_reason)
+            if validate
+            else message is not None and choice.finish_reason == "stop"
+        )
+        if cacheable and valid:
+            self.cache.put_completion(key, message)
+        return message
+
+    @staticmethod
+    def _chat_key(body: dict) -> str:
+        # the key covers the whole request, model and messages included
+        encoded = orjson.dumps(body, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def _is_ranking(message: Optional[str], finish_reason: str) -> bool:
+        return (
+            finish_reason == "stop"
+            and MercariAgent._parse_item_ids(message) is not None
         )
-        message = response.choices[0].message.content
+
+    @staticmethod
+    def _parse_item_ids(message: Optional[str]) -> Optional[list]:
+        """
+        The item_ids of a ranker reply, or None if it is missing, cut off or malformed.
+        """
         try:
-            topk_ids = json.loads(message)
-        except Exception:
-            topk_ids = []
-        topk = []
-        for pid in topk_ids:
-            for item in search_results:
-                if str(item.get("item_id")) == str(pid):
-                    topk.append(item)
-                    break
+            item_ids = orjson.loads(message)["item_ids"]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            return None
+        return item_ids if isinstance(item_ids, list) else None
+
+    @staticmethod
+    def _pick_products(
+        message: Optional[str], search_results: List[MercariItem], k: int
+    ) -> dict:
+        topk_ids = MercariAgent._parse_item_ids(message) or []
+        by_id = {str(item.item_id): item for item in search_results}
+        topk = [by_id[str(pid)] for pid in topk_ids if str(pid) in by_id]
+        if not topk:
+            # the ranker made up ids, or its reply was cut off by max_tokens or refused;
+            # fall back to Mercari's ordering rather than recommend nothing
+            print("[Agent] Ranker returned no usable item_id, using search order.")
+            topk = search_results[:k]
         return {
             "message": message,
             "products": topk,
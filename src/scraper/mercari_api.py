@@ -0,0 +1,197 @@
+import time
+import uuid
+import base64
+import asyncio
+import weakref
+import threading
+from typing import Optional, List
+
+import httpx
+import orjson
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+SEARCH_API_URL = "https://api.mercari.jp/v2/entities:search"
+ITEM_API_URL = "https://api.mercari.jp/items/get"
+ITEM_URL = "https://jp.mercari.com/item/"
+SHOP_ITEM_URL = "https://jp.mercari.com/shops/product/"
+PAGE_SIZE = 120
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class DPoPSigner:
+    """
+    Signs DPoP proofs (ES256 JWTs) the way the Mercari web app does, with an ephemeral
+    P-256 key generated per session.
+    """
+
+    def __init__(self):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.session_id = str(uuid.uuid4())
+        numbers = self.key.public_key().public_numbers()
+        header = {
+            "typ": "dpop+jwt",
+            "alg": "ES256",
+            "jwk": {
+                "crv": "P-256",
+                "kty": "EC",
+                "x": _b64url(numbers.x.to_bytes(32, "big")),
+                "y": _b64url(numbers.y.to_bytes(32, "big")),
+            },
+        }
+        # the header never changes, encode it once
+        self._header = _b64url(orjson.dumps(header))
+
+    def sign(self, url: str, method: str) -> str:
+        payload = {
+            "iat": int(time.time()),
+            "jti": str(uuid.uuid4()),
+            "htu": url,
+            "htm": method,
+            "uuid": self.session_id,
+        }
+        signing_input = f"{self._header}.{_b64url(orjson.dumps(payload))}"
+        der = self.key.sign(signing_input.encode("ascii"), ec.ECDSA(hashes.SHA256()))
+        # JWS wants the raw r||s signature, not DER
+        r, s = decode_dss_signature(der)
+        signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        return f"{signing_input}.{_b64url(signature)}"
+
+
+_signer: Optional[DPoPSigner] = None
+_client: Optional[httpx.Client] = None
+# async clients are tied to the event loop that opened their connections
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _get_signer() -> DPoPSigner:
+    global _signer
+    with _lock:
+        if _signer is None:
+            _signer = DPoPSigner()
+    return _signer
+
+
+def _get_client() -> httpx.Client:
+    """
+    Shared HTTP client so searches reuse pooled connections.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(timeout=15.0)
+    return _client
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(timeout=15.0)
+    return client
+
+
+def _headers(url: str, method: str) -> dict:
+    return {
+        "DPoP": _get_signer().sign(url, method),
+        "X-Platform": "web",
+        "Accept": "application/json",
+        "Content-Type": "application/json; charset=utf-8",
+    }
+
+
+def build_search_body(search_condition: dict, page_size: int = PAGE_SIZE) -> dict:
+    return {
+        "userId": "",
+        "pageSize": page_size,
+        "pageToken": "",
+        "searchSessionId": uuid.uuid4().hex,
+        "indexRouting": "INDEX_ROUTING_UNSPECIFIED",
+        "thumbnailTypes": [],
+        "searchCondition": search_condition,
+        "defaultDatasets": ["DATASET_TYPE_MERCARI", "DATASET_TYPE_BEYOND"],
+        "serviceFrom": "suruga",
+        "withItemBrand": False,
+        "withItemSize": False,
+        "withItemPromotions": False,
+        "withItemSizes": False,
+        "withShopname": False,
+    }
+
+
+def item_url(item_id: str, item_type: Optional[str]) -> str:
+    # shop ("beyond") listings live under a different path than C2C listings
+    if item_type == "ITEM_TYPE_BEYOND":
+        return SHOP_ITEM_URL + item_id
+    return ITEM_URL + item_id
+
+
+def format_price(price) -> str:
+    try:
+        return f"¥{int(price):,}"
+    except (TypeError, ValueError):
+        return "N/A"
+
+
+def search_items(search_condition: dict, limit: int = 20) -> List[dict]:
+    """
+    Call Mercari's search API and return the raw item dicts.
+    """
+    client = _get_client()
+    response = client.post(
+        SEARCH_API_URL,
+        headers=_headers(SEARCH_API_URL, "POST"),
+        # the JSON content type is already in the headers
+        content=orjson.dumps(
+            build_search_body(search_condition, min(limit, PAGE_SIZE))
+        ),
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content).get("items", [])[:limit]
+
+
+async def search_items_async(search_condition: dict, limit: int = 20) -> List[dict]:
+    """
+    search_items on the running event loop.
+    """
+    client = _get_async_client()
+    response = await client.post(
+        SEARCH_API_URL,
+        headers=_headers(SEARCH_API_URL, "POST"),
+        # the JSON content type is already in the headers
+        content=orjson.dumps(
+            build_search_body(search_condition, min(limit, PAGE_SIZE))
+        ),
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content).get("items", [])[:limit]
+
+
+def get_item(item_id: str) -> dict:
+    """
+    Fetch a single (C2C) listing from Mercari's item API. Shop listings aren't served here.
+    """
+    client = _get_client()
+    # the DPoP proof covers the URL without the query string
+    response = client.get(
+        ITEM_API_URL, params={"id": item_id}, headers=_headers(ITEM_API_URL, "GET")
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)["data"]
+
+
+async def get_item_async(item_id: str) -> dict:
+    """
+    get_item on the running event loop.
+    """
+    client = _get_async_client()
+    response = await client.get(
+        ITEM_API_URL, params={"id": item_id}, headers=_headers(ITEM_API_URL, "GET")
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)["data"]
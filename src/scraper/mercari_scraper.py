@@ -1,19 +1,98 @@
+import os
+import queue
+import atexit
 import argparse
+import asyncio
+import logging
+import itertools
+import threading
+import time
 import urllib.parse
-from dataclasses import dataclass
-from typing import List, Optional, Any, Dict
+import orjson
+from collections import OrderedDict
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from typing import List, Optional, Any, Dict, Callable, Awaitable, Iterator, Union
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.driver_finder import DriverFinder
+from selenium.common.exceptions import TimeoutException
+
+from src.scraper.mercari_api import (
+    search_items,
+    search_items_async,
+    get_item,
+    get_item_async,
+    item_url,
+    format_price,
+)
 
 BASE_URL = "https://jp.mercari.com/search?keyword="
+# search results are reused for this long; listings churn, so keep it short
+SEARCH_CACHE_TTL = 120
+SEARCH_CACHE_SIZE = 32
+# item details change less often than search results
+ITEM_CACHE_TTL = 600
+ITEM_CACHE_SIZE = 1024
+# concurrent API searches in search_mercari_many
+MAX_CONCURRENT_SEARCHES = 8
+# requests the scraper never needs: analytics, fonts and image bytes (img.src stays
+# readable); the trailing * also matches the ?<timestamp> query Mercari's CDN adds
+BLOCKED_URLS = [
+    "*googletagmanager.com*",
+    "*google-analytics.com*",
+    "*doubleclick.net*",
+    "*sentry.io*",
+    "*.woff*",
+    "*.jpg*",
+    "*.jpeg*",
+    "*.png*",
+    "*.webp*",
+    "*.gif*",
+    "*.mp4*",
+]
+# rendered content shows up within a few seconds or not at all
+PAGE_WAIT_TIMEOUT = 8
+# concurrent detail lookups in scrape_many
+MAX_CONCURRENT_SCRAPES = 8
+# idle Chrome instances kept around for reuse, sized for the agent's default scrape fan-out
+DRIVER_POOL_SIZE = 5
+# headless Chrome minus the subsystems scraping doesn't need, for faster startup
+CHROME_ARGS = (
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-translate",
+    "--disable-sync",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    # no separate renderer processes for cross-site (ad/analytics) iframes
+    "--disable-features=Translate,BackForwardCache,AcceptCHFrame,MediaRouter,"
+    "IsolateOrigins,site-per-process",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--proxy-server=direct://",
+    "--proxy-bypass-list=*",
+    "--window-size=1280,900",
+)
+# set to "1" to render pages in Chrome instead of calling the JSON API (e.g. in CI)
+USE_SELENIUM_ENV = "MERCARI_USE_SELENIUM"
+
+logger = logging.getLogger(__name__)
 
 
 # --- type defs ---
-@dataclass
+# frozen so cached results can be shared between callers safely
+@dataclass(frozen=True, slots=True)
 class MercariItem:
     name: str
     price: str
@@ -23,7 +102,7 @@ class MercariItem:
     itemtype: Optional[str] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MercariItemDetail(MercariItem):
     description: Optional[str] = None
     item_condition: Optional[str] = None
@@ -34,72 +113,403 @@ class MercariItemDetail(MercariItem):
     seller_rating: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class MercariFilter:
     keyword: str = ""
     excludeKeyword: str = ""
     sort: str = "SORT_SCORE"
     order: str = "ORDER_DESC"
-    status: list = None
-    sizeId: list = None
-    categoryId: list = None
-    brandId: list = None
-    sellerId: list = None
+    status: list = field(default_factory=list)
+    sizeId: list = field(default_factory=list)
+    categoryId: list = field(default_factory=list)
+    brandId: list = field(default_factory=list)
+    sellerId: list = field(default_factory=list)
     priceMin: int = 0
     priceMax: int = 0
-    itemConditionId: list = None
-    shippingPayerId: list = None
-    shippingFromArea: list = None
-    shippingMethod: list = None
-    colorId: list = None
+    itemConditionId: list = field(default_factory=list)
+    shippingPayerId: list = field(default_factory=list)
+    shippingFromArea: list = field(default_factory=list)
+    shippingMethod: list = field(default_factory=list)
+    colorId: list = field(default_factory=list)
     hasCoupon: bool = False
     createdAfterDate: str = "0"
     createdBeforeDate: str = "0"
-    attributes: list = None
-    itemTypes: list = None
-    skuIds: list = None
-    shopIds: list = None
+    attributes: list = field(default_factory=list)
+    itemTypes: list = field(default_factory=list)
+    skuIds: list = field(default_factory=list)
+    shopIds: list = field(default_factory=list)
     promotionValidAt: Any = None
-    excludeShippingMethodIds: list = None
+    excludeShippingMethodIds: list = field(default_factory=list)
 
     def to_dict(self) -> Dict:
-        return {
-            "keyword": self.keyword,
-            "excludeKeyword": self.excludeKeyword,
-            "sort": self.sort,
-            "order": self.order,
-            "status": self.status or [],
-            "sizeId": self.sizeId or [],
-            "categoryId": self.categoryId or [],
-            "brandId": self.brandId or [],
-            "sellerId": self.sellerId or [],
-            "priceMin": self.priceMin,
-            "priceMax": self.priceMax,
-            "itemConditionId": self.itemConditionId or [],
-            "shippingPayerId": self.shippingPayerId or [],
-            "shippingFromArea": self.shippingFromArea or [],
-            "shippingMethod": self.shippingMethod or [],
-            "colorId": self.colorId or [],
-            "hasCoupon": self.hasCoupon,
-            "createdAfterDate": self.createdAfterDate,
-            "createdBeforeDate": self.createdBeforeDate,
-            "attributes": self.attributes or [],
-            "itemTypes": self.itemTypes or [],
-            "skuIds": self.skuIds or [],
-            "shopIds": self.shopIds or [],
-            "promotionValidAt": self.promotionValidAt,
-            "excludeShippingMethodIds": self.excludeShippingMethodIds or [],
-        }
+        return {name: getattr(self, name) for name in _FILTER_FIELDS}
+
+
+_FILTER_FIELDS = tuple(f.name for f in fields(MercariFilter))
+
+_SORT_MAP = {
+    "SORT_CREATED_TIME": "created_time",
+    "SORT_SCORE": "score",
+    "SORT_PRICE": "price",
+    "SORT_NUM_LIKES": "num_likes",
+}
+_ORDER_MAP = {"ORDER_DESC": "desc", "ORDER_ASC": "asc"}
+# (filter key, search page query parameter, conversion to the escaped value);
+# empty values are left out
+_URL_PARAM_MAP = (
+    ("keyword", "keyword", lambda keyword: urllib.parse.quote_plus(str(keyword))),
+    ("categoryId", "category_id", lambda ids: str(ids[0])),
+    ("priceMin", "price_min", str),
+    ("priceMax", "price_max", str),
+    ("itemConditionId", "item_condition_id", lambda ids: "%2C".join(map(str, ids))),
+    ("sort", "sort", _SORT_MAP.get),
+    ("order", "order", _ORDER_MAP.get),
+)
+SEARCH_PAGE_URL = "https://jp.mercari.com/search?"
+
+
+# --- selectors, built once instead of per element in the parse loops ---
+_FILTER_ITEM_SEL = (By.CSS_SELECTOR, "li[data-testid]")
+_BUTTON_SEL = (By.TAG_NAME, "button")
+_SPAN_SEL = (By.TAG_NAME, "span")
+_SELECT_SEL = (By.TAG_NAME, "select")
+_OPTION_SEL = (By.TAG_NAME, "option")
+_CHECKBOX_SEL = (By.CSS_SELECTOR, 'input[type="checkbox"]')
+_CHECKBOX_LABEL_SEL = (By.XPATH, "following-sibling::div//span")
+_PRICE_SEL = (By.CSS_SELECTOR, 'input[type="number"]')
+_TEXT_SEL = (By.CSS_SELECTOR, 'input[type="text"]')
+_THUMBNAIL_SELECTOR = 'a[data-testid="thumbnail-link"]'
+_ITEM_NAME_SELECTOR = '[data-testid="name"] h1'
+# thumbnail aria-labels are "<name>の画像 <price>"
+_IMG_LABEL_SEP = "の画像"
+
+
+# what a fresh session (data:,) or a released pooled driver (about:blank) shows
+_BLANK_URLS = ("about:blank", "data:,")
+
+
+# --- in-page scripts, each returns everything a page parse needs in one call ---
+# server-rendered pages embed their props as typed JSON; returns one prop or null
+_NEXT_DATA_JS = """
+const el = document.getElementById('__NEXT_DATA__');
+if (!el) return null;
+try {
+  const pageProps = (JSON.parse(el.textContent).props || {}).pageProps || {};
+  return pageProps[arguments[0]] || null;
+} catch (e) {
+  return null;
+}
+"""
+
+_HARVEST_SEARCH_JS = """
+return Array.from(document.querySelectorAll('a[data-testid="thumbnail-link"]'))
+  .filter(a => a.querySelector('.merItemThumbnail'))
+  .map(a => {
+    const t = a.querySelector('.merItemThumbnail');
+    const img = t.querySelector('img');
+    return {
+      href: a.href || null,
+      label: t.getAttribute('aria-label'),
+      id: t.getAttribute('id'),
+      itemtype: t.getAttribute('itemtype'),
+      src: img ? img.src || null : null,
+    };
+  });
+"""
+
+_HARVEST_ITEM_JS = """
+const text = sel => {
+  const el = document.querySelector(sel);
+  return el ? el.innerText.trim() : null;
+};
+const seller = '[data-testid="seller-link"] ';
+const star = document.querySelector(seller + '.merRating');
+return {
+  name: text('[data-testid="name"] h1'),
+  price: text('[data-testid="price"]'),
+  description: text('[data-testid="description"]'),
+  item_condition: text('[data-testid="商品の状態"]'),
+  categories: Array.from(
+    document.querySelectorAll('[data-testid="item-detail-category"] a'),
+    a => a.innerText.trim()
+  ),
+  images: Array.from(
+    document.querySelectorAll('[data-testid^="image-"] img'), img => img.src
+  ).filter(Boolean),
+  seller_name: text(seller + '.content__a9529387 p'),
+  seller_rating_count: text(seller + '.count__60fe6cce'),
+  seller_rating: star ? star.getAttribute('aria-label') : null,
+};
+"""
+
+# polls inside the page, so waiting costs one WebDriver call instead of one per poll
+_WAIT_FOR_SELECTOR_JS = """
+const [selector, timeout, done] = arguments;
+const start = Date.now();
+const check = () => {
+  if (document.querySelector(selector)) return done(true);
+  if (Date.now() - start > timeout) return done(false);
+  setTimeout(check, 100);
+};
+check();
+"""
 
 
 # --- functions ---
+def _use_selenium() -> bool:
+    # read per call, the environment may be filled from .env after this module is imported
+    return os.environ.get(USE_SELENIUM_ENV) == "1"
+
+
+def _load_page(driver, url: str):
+    try:
+        driver.get(url)
+    except TimeoutException:
+        # whatever has rendered so far is checked by the selector waits
+        logger.warning("Timeout loading %s", url)
+        return
+    # with page_load_strategy "none" get() returns before the new document replaces the
+    # blank one; a wait script started before that would be aborted by the swap
+    deadline = time.monotonic() + PAGE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            if driver.execute_script("return document.URL") not in _BLANK_URLS:
+                return
+        except Exception:
+            # the document was swapped mid-call
+            pass
+        time.sleep(0.05)
+    logger.warning("Timeout navigating to %s", url)
+
+
+def _wait_for_selector(
+    driver, selector: str, timeout: float = PAGE_WAIT_TIMEOUT
+) -> bool:
+    """
+    Wait until `selector` matches an element, return False on timeout.
+    """
+    try:
+        driver.set_script_timeout(timeout + 1)
+        return bool(
+            driver.execute_async_script(
+                _WAIT_FOR_SELECTOR_JS, selector, int(timeout * 1000)
+            )
+        )
+    except Exception as e:
+        logger.warning("Error waiting for %s: %s", selector, e)
+        return False
+
+
+class _TTLCache:
+    """
+    LRU cache with expiry. Concurrent misses on the same key are coalesced into one
+    computation (single flight), so identical lookups never launch a second scrape.
+    Only values `cacheable` accepts are stored.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int,
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cacheable = cacheable
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # key -> [lock held by the thread computing it, threads using that lock]
+        self.inflight = {}
+        # (event loop, key) -> task computing it
+        self.tasks = {}
+
+    def get(self, key):
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit and time.monotonic() - hit[0] < self.ttl:
+                self.entries.move_to_end(key)
+                return hit[1]
+        return None
+
+    def put(self, key, value):
+        if not self.cacheable(value):
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_or_compute(self, key, compute: Callable[[], Any]):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock:
+            entry = self.inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                # another thread may have filled it while we waited
+                value = self.get(key)
+                if value is None:
+                    value = compute()
+                    self.put(key, value)
+        finally:
+            with self.lock:
+                # the last thread out drops the lock, even when compute() raised
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self.inflight.pop(key, None)
+        return value
+
+    async def get_or_compute_async(self, key, compute: Callable[[], Awaitable[Any]]):
+        value = self.get(key)
+        if value is not None:
+            return value
+        task_key = (asyncio.get_running_loop(), key)
+        task = self.tasks.get(task_key)
+        if task is None:
+
+            async def run():
+                try:
+                    result = await compute()
+                    self.put(key, result)
+                    return result
+                finally:
+                    self.tasks.pop(task_key, None)
+
+            task = self.tasks[task_key] = asyncio.ensure_future(run())
+        # one cancelled caller must not cancel the lookup for everyone else
+        return await asyncio.shield(task)
+
+
+def _search_key(filters: dict, limit: int) -> tuple:
+    return (orjson.dumps(filters, option=orjson.OPT_SORT_KEYS), limit)
+
+
+# an empty result is more likely a timeout or a transient failure than a real answer
+_search_cache = _TTLCache(SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, cacheable=bool)
+# a Selenium scrape that timed out comes back without a name, retry it next time
+_item_cache = _TTLCache(
+    ITEM_CACHE_TTL, ITEM_CACHE_SIZE, cacheable=lambda detail: detail.name is not None
+)
+
+
+def _chrome_options() -> Options:
+    options = Options()
+    for arg in CHROME_ARGS:
+        options.add_argument(arg)
+    # return from get() as soon as navigation starts, _wait_for_selector decides when
+    # the content we need is there
+    options.page_load_strategy = "none"
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option(
+        "prefs", {"profile.managed_default_content_settings.images": 2}
+    )
+    return options
+
+
+# every pooled driver is launched with the same options, build them once
+_CHROME_OPTIONS = _chrome_options()
+
+
+class WebDriverPool:
+    """
+    Keeps up to `size` idle headless Chrome sessions for reuse, all driven by one shared
+    chromedriver process.
+    """
+
+    def __init__(self, size: int):
+        self.idle = queue.Queue(maxsize=size)
+        self.service: Optional[Service] = None
+        self.lock = threading.Lock()
+
+    def _new_driver(self) -> webdriver.Remote:
+        with self.lock:
+            if self.service is None:
+                service = Service()
+                # resolve chromedriver (and Chrome) the way webdriver.Chrome does,
+                # Service.start() can't do it on its own
+                finder = DriverFinder(service, _CHROME_OPTIONS)
+                if finder.get_browser_path():
+                    _CHROME_OPTIONS.binary_location = finder.get_browser_path()
+                    _CHROME_OPTIONS.browser_version = None
+                service.path = service.env_path() or finder.get_driver_path()
+                service.start()
+                self.service = service
+        # attach to the running chromedriver instead of letting each driver spawn its own;
+        # the Chrome connection adds the CDP command the remote driver lacks
+        driver = webdriver.Remote(
+            command_executor=ChromeRemoteConnection(self.service.service_url),
+            options=_CHROME_OPTIONS,
+        )
+        try:
+            for cmd, params in (
+                ("Network.enable", {}),
+                ("Network.setBlockedURLs", {"urls": BLOCKED_URLS}),
+            ):
+                driver.execute("executeCdpCommand", {"cmd": cmd, "params": params})
+        except Exception as e:
+            # blocking is an optimization, a driver without it still works
+            logger.warning("Could not set blocked URLs: %s", e)
+        driver.set_page_load_timeout(PAGE_WAIT_TIMEOUT)
+        return driver
+
+    @contextmanager
+    def acquire(self):
+        """
+        Borrow a driver (starting one if none is idle) and return it to the pool afterwards.
+        """
+        try:
+            driver = self.idle.get_nowait()
+        except queue.Empty:
+            driver = self._new_driver()
+        try:
+            yield driver
+        except BaseException:
+            # the browser may be in a bad state, don't hand it to the next caller
+            driver.quit()
+            raise
+        try:
+            # cheaper than a new browser, and the next caller starts from a clean page
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+            self.idle.put_nowait(driver)
+        except Exception:
+            driver.quit()
+
+    def close(self):
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        with self.lock:
+            if self.service is not None:
+                self.service.stop()
+                self.service = None
+
+
+_driver_pool = WebDriverPool(DRIVER_POOL_SIZE)
+atexit.register(_driver_pool.close)
+
+
 def get_filters(driver):
     filters = []
+    _wait_for_selector(driver, "#search-filter", timeout=5)
     try:
         # Get filter section
         filter_section = driver.find_element(By.ID, "search-filter")
         # Get all li[data-testid] filter conditions
-        filter_lis = filter_section.find_elements(By.CSS_SELECTOR, "li[data-testid]")
+        filter_lis = filter_section.find_elements(*_FILTER_ITEM_SEL)
         for li in filter_lis:
             filter_info = {}
             data_testid = li.get_attribute("data-testid")
@@ -107,17 +517,17 @@ def get_filters(driver):
 
             # Get title (use data-testid="filter-heading" or li button span)
             try:
-                title_btn = li.find_element(By.TAG_NAME, "button")
-                title_span = title_btn.find_element(By.TAG_NAME, "span")
+                title_btn = li.find_element(*_BUTTON_SEL)
+                title_span = title_btn.find_element(*_SPAN_SEL)
                 filter_info["title"] = title_span.text.strip()
             except Exception:
                 filter_info["title"] = data_testid
 
             # Check for select (dropdown)
             try:
-                select = li.find_element(By.TAG_NAME, "select")
+                select = li.find_element(*_SELECT_SEL)
                 options = []
-                for opt in select.find_elements(By.TAG_NAME, "option"):
+                for opt in select.find_elements(*_OPTION_SEL):
                     options.append(
                         {"value": opt.get_attribute("value"), "label": opt.text.strip()}
                     )
@@ -127,15 +537,13 @@ def get_filters(driver):
                 pass
 
             # Check for checkboxes (input[type="checkbox"])
-            checkboxes = li.find_elements(By.CSS_SELECTOR, 'input[type="checkbox"]')
+            checkboxes = li.find_elements(*_CHECKBOX_SEL)
             if checkboxes:
                 options = []
                 for cb in checkboxes:
                     # label is in the next span
                     try:
-                        label = cb.find_element(
-                            By.XPATH, "following-sibling::div//span"
-                        )
+                        label = cb.find_element(*_CHECKBOX_LABEL_SEL)
                         label_text = label.text.strip()
                     except Exception:
                         label_text = ""
@@ -150,7 +558,7 @@ def get_filters(driver):
                 filter_info["options"] = options
 
             # Check for number input (price)
-            price_inputs = li.find_elements(By.CSS_SELECTOR, 'input[type="number"]')
+            price_inputs = li.find_elements(*_PRICE_SEL)
             if price_inputs:
                 filter_info["type"] = "price"
                 filter_info["inputs"] = [
@@ -164,7 +572,7 @@ def get_filters(driver):
                 ]
 
             # Check for text input (brand, exclude keyword)
-            text_inputs = li.find_elements(By.CSS_SELECTOR, 'input[type="text"]')
+            text_inputs = li.find_elements(*_TEXT_SEL)
             if text_inputs:
                 filter_info["type"] = "text"
                 filter_info["inputs"] = [
@@ -177,201 +585,294 @@ def get_filters(driver):
 
             filters.append(filter_info)
     except Exception as e:
-        print("[Scraper] Error parsing filters:", e)
+        logger.warning("Error parsing filters: %s", e)
     return filters
 
 
 def build_search_url(filters: dict) -> str:
-    base_url = "https://jp.mercari.com/search"
-    params = {}
-    if filters.get("keyword"):
-        params["keyword"] = filters["keyword"]
-    if filters.get("categoryId"):
-        params["category_id"] = filters["categoryId"][0]
-    if filters.get("priceMin"):
-        params["price_min"] = filters["priceMin"]
-    if filters.get("priceMax"):
-        params["price_max"] = filters["priceMax"]
-    if filters.get("itemConditionId"):
-        params["item_condition_id"] = ",".join(filters["itemConditionId"])
-    if filters.get("sort"):
-        sort_map = {
-            "SORT_CREATED_TIME": "created_time",
-            "SORT_SCORE": "score",
-            "SORT_PRICE": "price",
-            "SORT_NUM_LIKES": "num_likes",
-        }
-        sort_val = sort_map.get(filters["sort"], None)
-        if sort_val:
-            params["sort"] = sort_val
-    if filters.get("order"):
-        order_map = {"ORDER_DESC": "desc", "ORDER_ASC": "asc"}
-        order_val = order_map.get(filters["order"], None)
-        if order_val:
-            params["order"] = order_val
-    query = urllib.parse.urlencode(params, doseq=True)
-    return f"{base_url}?{query}"
-
-
-def search_mercari(filters: dict, limit: int = 20) -> List[MercariItem]:
-    print(f"[Scraper] Searching Mercari with filters: {filters}")
-    url = build_search_url(filters)
-    print(f"[Scraper] URL: {url}")
+    # the parameter set is small and fixed, so format it directly instead of urlencode
+    parts = []
+    for key, param, convert in _URL_PARAM_MAP:
+        value = filters.get(key)
+        if value:
+            value = convert(value)
+            if value:
+                parts.append(f"{param}={value}")
+    return SEARCH_PAGE_URL + "&".join(parts)
+
+
+def build_search_condition(filters: dict) -> dict:
+    """
+    Map tool arguments onto the searchCondition of Mercari's search API.
+    """
+    fields = MercariFilter.__dataclass_fields__
+    known = {k: v for k, v in filters.items() if k in fields}
+    condition = MercariFilter(**known).to_dict()
+    # the API takes numeric ids, the tool schema uses strings
+    for key in ("itemConditionId", "categoryId"):
+        condition[key] = [int(v) for v in condition[key]]
+    return condition
 
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(options=options)
-
-    driver.get(url)
-    # filters_info = get_filters(driver)
-    # print("[Scraper] Filters:")
-    # import json
-    # print(json.dumps(filters_info, ensure_ascii=False, indent=2))
-    try:
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located(
-                (By.CSS_SELECTOR, 'a[data-testid="thumbnail-link"]')
-            )
-        )
-    except Exception as e:
-        print("[Scraper] Timeout waiting for product links:", e)
 
-    product_links = driver.find_elements(
-        By.CSS_SELECTOR, 'a[data-testid="thumbnail-link"]'
+def search_mercari(filters: Union[dict, str], limit: int = 20) -> List[MercariItem]:
+    """
+    Search Mercari, memoized for SEARCH_CACHE_TTL seconds. A plain string is searched
+    as the keyword.
+    """
+    if isinstance(filters, str):
+        filters = {"keyword": filters}
+    items = _search_cache.get_or_compute(
+        _search_key(filters, limit), lambda: _search_mercari(filters, limit)
     )
-    print(f"[Scraper] Found {len(product_links)} product links.")
+    return list(items)
 
-    items = []
-    for link in product_links:
+
+def _search_mercari(filters: dict, limit: int) -> List[MercariItem]:
+    logger.info("Searching Mercari with filters: %s", filters)
+    items = None
+    if not _use_selenium():
         try:
-            thumbnail_div = link.find_element(By.CLASS_NAME, "merItemThumbnail")
-            label = thumbnail_div.get_attribute("aria-label")
-            if label and "の画像" in label:
-                name, price = label.split("の画像", 1)
-                name = name.strip()
-                price = price.strip()
-            elif label:
-                name = label.strip()
-                price = "N/A"
-            else:
-                name = "N/A"
-                price = "N/A"
-            item_id = thumbnail_div.get_attribute("id")
-            itemtype = thumbnail_div.get_attribute("itemtype")
-            # get image url
-            image_url = None
-            try:
-                img_tag = thumbnail_div.find_element(By.TAG_NAME, "img")
-                image_url = img_tag.get_attribute("src")
-            except Exception:
-                pass
-            href = link.get_attribute("href")
-            items.append(
-                MercariItem(
-                    name=name,
-                    price=price,
-                    image=image_url,
-                    url=href if href else None,
-                    item_id=item_id,
-                    itemtype=itemtype,
-                )
-            )
+            raw = search_items(build_search_condition(filters), limit)
+            items = _to_items(filters, raw)
         except Exception as e:
-            print(f"[Scraper] Error parsing product: {e}")
-    driver.quit()
-    print(
-        f"[Scraper] Found {len(items)} items for query '{filters.get('keyword', '')}'."
+            logger.warning("API search failed, falling back to Selenium: %s", e)
+    if items is None:
+        items = _search_mercari_selenium(filters, limit)
+    return items
+
+
+search_mercari.cache_clear = _search_cache.clear
+
+
+async def search_mercari_async(
+    filters: Union[dict, str], limit: int = 20
+) -> List[MercariItem]:
+    """
+    search_mercari without blocking the event loop, sharing its cache.
+    """
+    if isinstance(filters, str):
+        filters = {"keyword": filters}
+    items = await _search_cache.get_or_compute_async(
+        _search_key(filters, limit), lambda: _search_mercari_async(filters, limit)
     )
-    return items[:limit]
+    return list(items)
+
+
+async def _search_mercari_async(filters: dict, limit: int) -> List[MercariItem]:
+    logger.info("Searching Mercari with filters: %s", filters)
+    items = None
+    if not _use_selenium():
+        try:
+            raw = await search_items_async(build_search_condition(filters), limit)
+            items = _to_items(filters, raw)
+        except Exception as e:
+            logger.warning("API search failed, falling back to Selenium: %s", e)
+    if items is None:
+        items = await asyncio.to_thread(_search_mercari_selenium, filters, limit)
+    return items
+
+
+async def search_mercari_many(
+    filters_list: List[dict], limit: int = 20
+) -> List[List[MercariItem]]:
+    """
+    Run several searches concurrently (at most MAX_CONCURRENT_SEARCHES at once).
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+
+    async def bounded(filters):
+        async with semaphore:
+            return await search_mercari_async(filters, limit)
+
+    return await asyncio.gather(*[bounded(filters) for filters in filters_list])
+
+
+def _to_items(filters: dict, raw_items: List[dict]) -> List[MercariItem]:
+    items = [
+        MercariItem(
+            name=raw.get("name") or "N/A",
+            price=format_price(raw.get("price")),
+            image=(raw.get("thumbnails") or [None])[0],
+            url=item_url(raw["id"], raw.get("itemType")),
+            item_id=raw["id"],
+            itemtype=raw.get("itemType"),
+        )
+        for raw in raw_items
+    ]
+    logger.info(
+        "Found %d items for query '%s'.", len(items), filters.get("keyword", "")
+    )
+    return items
+
+
+def _search_mercari_selenium(filters: dict, limit: int) -> List[MercariItem]:
+    url = build_search_url(filters)
+    logger.info("URL: %s", url)
+
+    with _driver_pool.acquire() as driver:
+        _load_page(driver, url)
+        # the JSON is in the initial HTML, so it is there before client rendering
+        _wait_for_selector(driver, f"#__NEXT_DATA__, {_THUMBNAIL_SELECTOR}")
+        # the blob's shape isn't guaranteed, anything unexpected falls through to the DOM
+        try:
+            raw_items = driver.execute_script(_NEXT_DATA_JS, "items")
+            if raw_items:
+                return _to_items(filters, raw_items[:limit])
+        except Exception as e:
+            logger.warning("Could not read items from __NEXT_DATA__: %s", e)
+        # one WebDriver call per filter element, so only read the panel when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Filters: %s",
+                orjson.dumps(get_filters(driver), option=orjson.OPT_INDENT_2).decode(),
+            )
+        if not _wait_for_selector(driver, _THUMBNAIL_SELECTOR):
+            logger.warning("Timeout waiting for product links.")
+
+        # one round-trip for every product instead of ~6 WebDriver calls per product
+        product_links = driver.execute_script(_HARVEST_SEARCH_JS)
+    logger.info("Found %d product links.", len(product_links))
+
+    # stop parsing once `limit` items are in
+    items = list(itertools.islice(_iter_links(product_links), limit))
+    logger.info(
+        "Found %d items for query '%s'.", len(items), filters.get("keyword", "")
+    )
+    return items
+
+
+def _iter_links(product_links: List[dict]) -> Iterator[MercariItem]:
+    for link in product_links:
+        name, sep, price = (link["label"] or "").partition(_IMG_LABEL_SEP)
+        if sep:
+            name, price = name.rstrip(), price.lstrip()
+        else:
+            name, price = name.strip() or "N/A", "N/A"
+        yield MercariItem(
+            name=name,
+            price=price,
+            image=link["src"],
+            url=link["href"] or None,
+            item_id=link["id"],
+            itemtype=link["itemtype"],
+        )
 
 
 def scrape_mercari_item(item: MercariItem) -> MercariItemDetail:
     """
-    Scrape detailed info from a single Mercari item page.
+    Get detailed info for a single Mercari item, from the item API when possible.
     Args:
-        url (str): The URL of the Mercari item.
+        item (MercariItem): The search result to look up.
     Returns:
-        dict: Detailed item info.
+        MercariItemDetail: Detailed item info.
     """
+    return _item_cache.get_or_compute(item.item_id, lambda: _scrape_mercari_item(item))
 
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(options=options)
 
-    driver.get(item.url)
-    try:
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '[data-testid="name"] h1'))
-        )
-    except Exception as e:
-        print("[Scraper] Timeout waiting for item detail:", e)
-    result = {}
+scrape_mercari_item.cache_clear = _item_cache.clear
 
-    try:
-        name_elem = driver.find_element(By.CSS_SELECTOR, '[data-testid="name"] h1')
-        result["name"] = name_elem.text.strip()
-    except Exception:
-        result["name"] = None
 
-    try:
-        price_elem = driver.find_element(By.CSS_SELECTOR, '[data-testid="price"]')
-        result["price"] = price_elem.text.strip()
-    except Exception:
-        result["price"] = None
+def _scrape_mercari_item(item: MercariItem) -> MercariItemDetail:
+    # shop listings aren't served by the item API
+    if not _use_selenium() and item.itemtype != "ITEM_TYPE_BEYOND":
+        try:
+            return _item_from_api(item, get_item(item.item_id))
+        except Exception as e:
+            logger.warning("Item API failed, falling back to Selenium: %s", e)
+    return _scrape_mercari_item_selenium(item)
 
-    try:
-        desc_elem = driver.find_element(By.CSS_SELECTOR, '[data-testid="description"]')
-        result["description"] = desc_elem.text.strip()
-    except Exception:
-        result["description"] = None
 
-    try:
-        status_elem = driver.find_element(By.CSS_SELECTOR, '[data-testid="商品の状態"]')
-        result["item_condition"] = status_elem.text.strip()
-    except Exception:
-        result["item_condition"] = None
+async def scrape_mercari_item_async(
+    item: MercariItem, executor: Optional[Executor] = None
+) -> MercariItemDetail:
+    """
+    scrape_mercari_item without blocking the event loop. The Selenium fallback runs on
+    `executor` (the default executor if None).
+    """
+    return await _item_cache.get_or_compute_async(
+        item.item_id, lambda: _scrape_mercari_item_async(item, executor)
+    )
 
-    try:
-        category_elems = driver.find_elements(
-            By.CSS_SELECTOR, '[data-testid="item-detail-category"] a'
-        )
-        result["categories"] = [a.text.strip() for a in category_elems]
-    except Exception:
-        result["categories"] = []
 
-    try:
-        image_elems = driver.find_elements(
-            By.CSS_SELECTOR, '[data-testid^="image-"] img'
-        )
-        result["images"] = [
-            img.get_attribute("src") for img in image_elems if img.get_attribute("src")
-        ]
-    except Exception:
-        result["images"] = []
+async def _scrape_mercari_item_async(
+    item: MercariItem, executor: Optional[Executor]
+) -> MercariItemDetail:
+    if not _use_selenium() and item.itemtype != "ITEM_TYPE_BEYOND":
+        try:
+            return _item_from_api(item, await get_item_async(item.item_id))
+        except Exception as e:
+            logger.warning("Item API failed, falling back to Selenium: %s", e)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, _scrape_mercari_item_selenium, item
+    )
 
-    try:
-        seller_elem = driver.find_element(
-            By.CSS_SELECTOR, '[data-testid="seller-link"] .content__a9529387 p'
-        )
-        result["seller_name"] = seller_elem.text.strip()
-        rating_elem = driver.find_element(
-            By.CSS_SELECTOR, '[data-testid="seller-link"] .count__60fe6cce'
-        )
-        result["seller_rating_count"] = rating_elem.text.strip()
-        star_elem = driver.find_element(
-            By.CSS_SELECTOR, '[data-testid="seller-link"] .merRating'
-        )
-        result["seller_rating"] = star_elem.get_attribute("aria-label")
-    except Exception:
-        result["seller_name"] = None
-        result["seller_rating_count"] = None
-        result["seller_rating"] = None
 
-    driver.quit()
+async def scrape_many(
+    items: List[MercariItem], executor: Optional[Executor] = None
+) -> List[MercariItemDetail]:
+    """
+    Look up several items concurrently (at most MAX_CONCURRENT_SCRAPES at once).
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCRAPES)
+
+    async def bounded(item):
+        async with semaphore:
+            return await scrape_mercari_item_async(item, executor)
+
+    return await asyncio.gather(*[bounded(item) for item in items])
+
+
+def _item_from_api(item: MercariItem, data: dict) -> MercariItemDetail:
+    category = data.get("item_category") or {}
+    seller = data.get("seller") or {}
+    return MercariItemDetail(
+        name=data.get("name"),
+        price=format_price(data.get("price")),
+        image=item.image,
+        url=item.url,
+        item_id=item.item_id,
+        itemtype=item.itemtype,
+        description=data.get("description"),
+        item_condition=(data.get("item_condition") or {}).get("name"),
+        categories=[
+            name
+            for name in (
+                category.get("root_category_name"),
+                category.get("parent_category_name"),
+                category.get("name"),
+            )
+            if name
+        ],
+        images=data.get("photos") or [],
+        seller_name=seller.get("name"),
+        seller_rating_count=(
+            str(seller["num_ratings"])
+            if seller.get("num_ratings") is not None
+            else None
+        ),
+        seller_rating=(
+            str(seller["star_rating_score"])
+            if seller.get("star_rating_score") is not None
+            else None
+        ),
+    )
+
+
+def _scrape_mercari_item_selenium(item: MercariItem) -> MercariItemDetail:
+    with _driver_pool.acquire() as driver:
+        _load_page(driver, item.url)
+        _wait_for_selector(driver, f"#__NEXT_DATA__, {_ITEM_NAME_SELECTOR}")
+        try:
+            data = driver.execute_script(_NEXT_DATA_JS, "item")
+            if data and data.get("name"):
+                return _item_from_api(item, data)
+        except Exception as e:
+            logger.warning("Could not read item from __NEXT_DATA__: %s", e)
+        if not _wait_for_selector(driver, _ITEM_NAME_SELECTOR):
+            logger.warning("Timeout waiting for item detail.")
+        # one round-trip for the whole page instead of one per field
+        result = driver.execute_script(_HARVEST_ITEM_JS)
+
     return MercariItemDetail(
         name=result.get("name"),
         price=result.get("price"),
@@ -395,5 +896,6 @@ if __name__ == "__main__":
         "keyword", help="Search keyword, e.g. python mercari_scraper.py Knife", type=str
     )
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[Scraper] %(message)s")
     items = search_mercari(args.keyword)
     print(items)
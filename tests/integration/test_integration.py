@@ -1,12 +1,15 @@
 import pytest
+from dotenv import load_dotenv
 from src.agent.mercari import MercariAgent
 
+load_dotenv()
+
 
 @pytest.mark.integration
 def test_agent_real():
     agent = MercariAgent()
     user_input = "I want to buy a used iPhone. under 15000 yen."
-    result = agent.agent_respond(user_input)
+    result = agent.agent_respond_sync(user_input)
     assert "message" in result
     assert "products" in result
     assert isinstance(result["products"], list)
@@ -0,0 +1,292 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from openai.types.responses import Response
+
+import src.agent.mercari as mercari
+from src.agent.mercari import DEFAULT_TOP_K, MAX_TOP_K, MercariAgent, _top_k
+from src.scraper.mercari_scraper import MercariItem, MercariItemDetail
+
+ITEMS = [
+    MercariItem(name=f"iPhone {i}", price="¥10,000", item_id=f"m{i}") for i in range(3)
+]
+
+
+def function_call(name: str, arguments: dict, call_id: str = "c1") -> dict:
+    return {
+        "type": "function_call",
+        "id": f"fc-{call_id}",
+        "call_id": call_id,
+        "name": name,
+        "arguments": orjson.dumps(arguments).decode(),
+        "status": "completed",
+    }
+
+
+def message(text: str) -> dict:
+    return {
+        "type": "message",
+        "id": "msg",
+        "role": "assistant",
+        "status": "completed",
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }
+
+
+def response(*output: dict) -> Response:
+    return Response.model_validate(
+        {
+            "id": "resp",
+            "object": "response",
+            "created_at": 0,
+            "model": "gpt-4.1-mini",
+            "output": list(output),
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "status": "completed",
+        }
+    )
+
+
+class FakeStream:
+    def __init__(self, response: Response):
+        self.response = response
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def __aiter__(self):
+        for item in self.response.output:
+            if item.type == "function_call":
+                yield SimpleNamespace(type="response.output_item.done", item=item)
+                # let work started for the event run while the rest streams in
+                await asyncio.sleep(0)
+            else:
+                yield SimpleNamespace(
+                    type="response.output_text.delta", delta=item.content[0].text
+                )
+
+    async def get_final_response(self):
+        return self.response
+
+
+class FakeResponses:
+    """
+    Replays `replies` (one Response per model turn) and records the request bodies.
+    """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    def stream(self, **body):
+        self.requests.append(body)
+        return FakeStream(self.replies.pop(0))
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    async def search(filters, *args, **kwargs):
+        return list(ITEMS)
+
+    async def scrape(item, *args, **kwargs):
+        return MercariItemDetail(name=item.name, price=item.price, item_id=item.item_id)
+
+    monkeypatch.setattr(mercari, "search_mercari_async", search)
+    monkeypatch.setattr(mercari, "scrape_mercari_item_async", scrape)
+    return MercariAgent("test-key", use_cache=False)
+
+
+def use_responses(monkeypatch, replies) -> FakeResponses:
+    responses = FakeResponses(replies)
+    client = SimpleNamespace(responses=responses)
+    monkeypatch.setattr(mercari, "get_client", lambda api_key: client)
+    return responses
+
+
+# --- top_k ---
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, DEFAULT_TOP_K),
+        (0, DEFAULT_TOP_K),
+        (2, 2),
+        (-1, 1),
+        (99, MAX_TOP_K),
+        (2.5, 2),
+        ("3", 3),
+        ("three", DEFAULT_TOP_K),
+        (float("inf"), DEFAULT_TOP_K),
+        ([3], DEFAULT_TOP_K),
+    ],
+)
+def test_top_k_is_bounded(value, expected):
+    assert _top_k(value) == expected
+
+
+# --- warmup ---
+def test_warmup_swallows_connection_errors(monkeypatch):
+    async def retrieve(model):
+        raise ConnectionError("offline")
+
+    client = SimpleNamespace(models=SimpleNamespace(retrieve=retrieve))
+    monkeypatch.setattr(mercari, "get_client", lambda api_key: client)
+    agent = MercariAgent("test-key", use_cache=False)
+    assert asyncio.run(agent.warmup()) is None
+
+
+# --- tool loop ---
+class BrokenStream(FakeStream):
+    async def __aiter__(self):
+        async for event in super().__aiter__():
+            yield event
+        raise ConnectionError("stream dropped")
+
+
+def test_pending_searches_are_cancelled_when_the_turn_fails(agent, monkeypatch):
+    started = []
+
+    async def slow_search(filters, *args, **kwargs):
+        started.append(asyncio.current_task())
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(mercari, "search_mercari_async", slow_search)
+    responses = use_responses(monkeypatch, [])
+    responses.stream = lambda **body: BrokenStream(
+        response(function_call("mercari_search", {"keyword": "iPhone"}))
+    )
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await agent.agent_respond("used iPhone")
+        await asyncio.sleep(0)
+        # checked inside the loop, asyncio.run cancels leftovers on its own
+        assert len(started) == 1 and started[0].cancelled()
+
+    asyncio.run(run())
+
+
+def test_unknown_tool_ends_without_a_result(agent, monkeypatch):
+    use_responses(
+        monkeypatch,
+        [
+            response(
+                function_call("mercari_search", {"keyword": "iPhone"}),
+                function_call("delete_everything", {}, call_id="c2"),
+            )
+        ],
+    )
+    assert asyncio.run(agent.agent_respond("used iPhone")) is None
+
+
+# --- trivial inputs ---
+@pytest.mark.parametrize("user_input", ["", "   ", "?", "Hello", "...", "!!"])
+def test_trivial_inputs_get_the_canned_reply(user_input):
+    assert MercariAgent._trivial_response(user_input) == {
+        "message": mercari.TRIVIAL_INPUT_MESSAGE,
+        "products": [],
+    }
+
+
+@pytest.mark.parametrize("user_input", ["knife", "iPhone 13", "包丁"])
+def test_real_requests_are_not_trivial(user_input):
+    assert MercariAgent._trivial_response(user_input) is None
+
+
+def test_trivial_inputs_never_reach_the_model(agent, monkeypatch):
+    responses = use_responses(monkeypatch, [])
+
+    async def no_batch(endpoint, bodies, poll_interval):
+        assert bodies == {}
+        return {}
+
+    monkeypatch.setattr(agent, "_run_batch", no_batch)
+    chunks = []
+
+    async def run():
+        async for chunk in agent.agent_respond_stream("?"):
+            chunks.append(chunk)
+        return await agent.agent_respond_batch(["", "hi"])
+
+    batch = asyncio.run(run())
+    assert chunks[0] == mercari.TRIVIAL_INPUT_MESSAGE
+    assert [result["products"] for result in batch] == [[], []]
+    assert responses.requests == []
+
+
+# --- turn limit ---
+def test_last_turn_disables_tools(agent, monkeypatch):
+    responses = use_responses(monkeypatch, [])
+
+    def stream(**body):
+        responses.requests.append(body)
+        if body.get("tool_choice") == "none":
+            return FakeStream(response(message("Here you go")))
+        # a model that would keep searching forever
+        turn = len(responses.requests)
+        return FakeStream(
+            response(
+                function_call(
+                    "mercari_search", {"keyword": f"iPhone {turn}"}, f"c{turn}"
+                )
+            )
+        )
+
+    responses.stream = stream
+    result = asyncio.run(agent.agent_respond("used iPhone"))
+
+    assert len(responses.requests) == mercari.MAX_TURNS
+    assert [body.get("tool_choice") for body in responses.requests] == [None] * (
+        mercari.MAX_TURNS - 1
+    ) + ["none"]
+    # tools stay in the request so the cached prompt prefix matches
+    assert all(body["tools"] == mercari.TOOLS for body in responses.requests)
+    assert result["message"] == "Here you go"
+    assert [p.item_id for p in result["products"]] == ["m0", "m1", "m2"]
+
+
+# --- batch ---
+def test_batch_results_line_up_with_inputs(agent, monkeypatch):
+    submitted = []
+
+    async def run_batch(endpoint, bodies, poll_interval):
+        submitted.append((endpoint, bodies))
+        first, _ = bodies
+        # the second request failed inside the batch
+        return {
+            first: response(
+                function_call("mercari_search", {"keyword": "iPhone"})
+            ).model_dump()
+        }
+
+    monkeypatch.setattr(agent, "_run_batch", run_batch)
+    responses = use_responses(
+        monkeypatch,
+        [
+            response(message("iPhones")),
+            response(function_call("mercari_search", {"keyword": "knife"})),
+            response(message("Knives")),
+        ],
+    )
+    inputs = ["used iPhone", "?", "used iPhone", "knife"]
+    results = asyncio.run(agent.agent_respond_batch(inputs))
+
+    ((endpoint, bodies),) = submitted
+    assert endpoint == "/v1/responses"
+    # duplicates are sent once and trivial inputs not at all
+    assert len(bodies) == 2
+    assert [result["message"] for result in results] == [
+        "iPhones",
+        mercari.TRIVIAL_INPUT_MESSAGE,
+        "iPhones",
+        "Knives",
+    ]
+    assert [p.item_id for p in results[3]["products"]] == ["m0", "m1", "m2"]
+    # one live follow-up turn for the batched request, two for the failed one
+    assert len(responses.requests) == 3
@@ -0,0 +1,106 @@
+import base64
+
+import httpx
+import orjson
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+import src.scraper.mercari_api as api
+
+
+def b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# --- DPoPSigner ---
+def test_dpop_proof_is_a_valid_es256_jwt():
+    signer = api.DPoPSigner()
+    proof = signer.sign(api.SEARCH_API_URL, "POST")
+    header_b64, payload_b64, signature_b64 = proof.split(".")
+    header = orjson.loads(b64url_decode(header_b64))
+    payload = orjson.loads(b64url_decode(payload_b64))
+
+    assert header["typ"] == "dpop+jwt"
+    assert header["alg"] == "ES256"
+    assert payload["htu"] == api.SEARCH_API_URL
+    assert payload["htm"] == "POST"
+    assert payload["uuid"] == signer.session_id
+
+    # the signature verifies against the public key in the header
+    jwk = header["jwk"]
+    public_key = ec.EllipticCurvePublicNumbers(
+        int.from_bytes(b64url_decode(jwk["x"]), "big"),
+        int.from_bytes(b64url_decode(jwk["y"]), "big"),
+        ec.SECP256R1(),
+    ).public_key()
+    raw = b64url_decode(signature_b64)
+    assert len(raw) == 64
+    der = encode_dss_signature(
+        int.from_bytes(raw[:32], "big"), int.from_bytes(raw[32:], "big")
+    )
+    public_key.verify(
+        der, f"{header_b64}.{payload_b64}".encode(), ec.ECDSA(hashes.SHA256())
+    )
+
+
+def test_dpop_proofs_are_unique():
+    signer = api.DPoPSigner()
+    first = orjson.loads(b64url_decode(signer.sign("u", "GET").split(".")[1]))
+    second = orjson.loads(b64url_decode(signer.sign("u", "GET").split(".")[1]))
+    assert first["jti"] != second["jti"]
+
+
+# --- HTTP calls ---
+@pytest.fixture
+def sent(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        if request.url.path.endswith("entities:search"):
+            items = [{"id": f"m{i}"} for i in range(5)]
+            return httpx.Response(200, content=orjson.dumps({"items": items}))
+        return httpx.Response(200, content=orjson.dumps({"data": {"name": "Knife"}}))
+
+    monkeypatch.setattr(
+        api, "_client", httpx.Client(transport=httpx.MockTransport(handler))
+    )
+    return seen
+
+
+def test_search_items_posts_the_condition(sent):
+    assert api.search_items({"keyword": "knife"}, limit=3) == [
+        {"id": "m0"},
+        {"id": "m1"},
+        {"id": "m2"},
+    ]
+    (request,) = sent
+    body = orjson.loads(request.content)
+    assert body["searchCondition"] == {"keyword": "knife"}
+    assert body["pageSize"] == 3
+    assert request.headers["DPoP"].count(".") == 2
+    assert request.headers["Content-Type"].startswith("application/json")
+
+
+def test_get_item_signs_the_url_without_the_query(sent):
+    assert api.get_item("m1") == {"name": "Knife"}
+    (request,) = sent
+    assert request.url.params["id"] == "m1"
+    payload = orjson.loads(b64url_decode(request.headers["DPoP"].split(".")[1]))
+    assert payload["htu"] == api.ITEM_API_URL
+    assert payload["htm"] == "GET"
+
+
+# --- formatting ---
+@pytest.mark.parametrize(
+    "price, expected", [(14800, "¥14,800"), ("300", "¥300"), (None, "N/A")]
+)
+def test_format_price(price, expected):
+    assert api.format_price(price) == expected
+
+
+def test_item_url_routes_shop_listings():
+    assert api.item_url("m1", "ITEM_TYPE_MERCARI") == api.ITEM_URL + "m1"
+    assert api.item_url("abc", "ITEM_TYPE_BEYOND") == api.SHOP_ITEM_URL + "abc"
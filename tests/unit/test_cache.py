@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.agent.cache import ResponseCache
+from src.scraper.mercari_scraper import MercariItemDetail, _TTLCache
+
+PRODUCT = MercariItemDetail(name="iPhone 12", price="¥14,800", item_id="m1")
+
+
+def make_cache(embeddings=None, **kwargs):
+    cache = ResponseCache("test-key", "test-model", path=None, **kwargs)
+    embeddings = embeddings or {}
+
+    async def embed(text):
+        return embeddings.get(text)
+
+    cache.embed = embed
+    return cache
+
+
+# --- ResponseCache ---
+def test_exact_hit_ignores_case_and_whitespace():
+    cache = make_cache()
+    cache.put("Used iPhone", {"message": "Here you go", "products": [PRODUCT]})
+    result, embedding = asyncio.run(cache.lookup("  used iphone "))
+    assert result == {"message": "Here you go", "products": [PRODUCT]}
+    assert embedding is None
+
+
+def test_semantic_hit_above_threshold():
+    cache = make_cache({"cheap iphone": [0.6, 0.8], "used iphone": [0.6, 0.8]})
+    cache.put("used iphone", {"message": "m", "products": [PRODUCT]}, [0.6, 0.8])
+    result, embedding = asyncio.run(cache.lookup("cheap iphone"))
+    assert result["products"] == [PRODUCT]
+    assert embedding == [0.6, 0.8]
+
+
+def test_semantic_miss_returns_embedding_for_put():
+    cache = make_cache({"knife": [1.0, 0.0]})
+    cache.put("used iphone", {"message": "m", "products": [PRODUCT]}, [0.0, 1.0])
+    result, embedding = asyncio.run(cache.lookup("knife"))
+    assert result is None
+    assert embedding == [1.0, 0.0]
+
+
+def test_expired_entries_are_pruned(monkeypatch):
+    cache = make_cache(ttl_hours=1)
+    cache.put("used iphone", {"message": "m", "products": []}, [1.0, 0.0])
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 3601)
+    result, _ = asyncio.run(cache.lookup("used iphone"))
+    assert result is None
+    assert cache.embeddings == {}
+
+
+def test_completions_expire(monkeypatch):
+    cache = make_cache(ttl_hours=1)
+    cache.put_completion("k", '{"item_ids": ["m1"]}')
+    assert cache.get_completion("k") == '{"item_ids": ["m1"]}'
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 3601)
+    assert cache.get_completion("k") is None
+
+
+def test_name_embeddings_round_trip():
+    cache = make_cache()
+    cache.put_name_embeddings({"iPhone 12": [0.5, 0.25]})
+    found = cache.get_name_embeddings(["iPhone 12", "Knife"])
+    assert list(found) == ["iPhone 12"]
+    assert list(found["iPhone 12"]) == [0.5, 0.25]
+
+
+# --- _TTLCache ---
+def test_ttl_cache_expires(monkeypatch):
+    cache = _TTLCache(ttl=10, maxsize=2)
+    cache.put("a", 1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = _TTLCache(ttl=10, maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+
+def test_ttl_cache_coalesces_concurrent_threads():
+    cache = _TTLCache(ttl=10, maxsize=8)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_compute("k", compute))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_ttl_cache_coalesces_concurrent_tasks():
+    cache = _TTLCache(ttl=10, maxsize=8)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(
+            *[cache.get_or_compute_async("k", compute) for _ in range(5)]
+        )
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert len(calls) == 1
+
+
+def test_ttl_cache_does_not_cache_failures():
+    cache = _TTLCache(ttl=10, maxsize=8)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("scrape failed")
+        return "value"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_compute_async("k", compute))
+    assert asyncio.run(cache.get_or_compute_async("k", compute)) == "value"
+    assert len(calls) == 2
+
+
+def test_ttl_cache_skips_uncacheable_values():
+    cache = _TTLCache(ttl=10, maxsize=8, cacheable=lambda d: d.name is not None)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return MercariItemDetail(name=None, price=None)
+
+    cache.get_or_compute("m1", compute)
+    cache.get_or_compute("m1", compute)
+    assert len(calls) == 2
+
+
+def test_ttl_cache_releases_lock_when_compute_raises():
+    cache = _TTLCache(ttl=10, maxsize=8)
+
+    def fail():
+        raise RuntimeError("scrape failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", fail)
+    assert cache.inflight == {}
+    assert cache.get_or_compute("k", lambda: "value") == "value"
+    assert cache.inflight == {}
+
+
+def test_ttl_cache_waiters_retry_after_failure():
+    cache = _TTLCache(ttl=10, maxsize=8)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError("scrape failed")
+        return "value"
+
+    results = []
+
+    def lookup():
+        try:
+            results.append(cache.get_or_compute("k", compute))
+        except RuntimeError:
+            results.append("error")
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the first computation fails, the next waiter recomputes and the rest share it
+    assert sorted(results) == ["error", "value", "value", "value"]
+    assert len(calls) == 2
+    assert cache.inflight == {}
@@ -0,0 +1,186 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import src.agent.mercari as mercari
+from src.agent.cache import ResponseCache
+from src.agent.mercari import MercariAgent
+from src.scraper.mercari_scraper import MercariItem
+
+ITEMS = [
+    MercariItem(name="iPhone 11", price="¥12,000", item_id="m1"),
+    MercariItem(name="iPhone 12", price="¥14,800", item_id="m2"),
+    MercariItem(name="iPhone case", price="¥500", item_id="m3"),
+]
+
+
+class FakeCompletions:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        content, finish_reason = self.replies.pop(0)
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    finish_reason=finish_reason,
+                    message=SimpleNamespace(content=content),
+                )
+            ]
+        )
+
+
+@pytest.fixture
+def agent():
+    agent = MercariAgent("test-key", use_cache=False)
+    agent.cache = ResponseCache("test-key", "test-model", path=None)
+    return agent
+
+
+def use_replies(monkeypatch, replies) -> FakeCompletions:
+    completions = FakeCompletions(replies)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(mercari, "get_client", lambda api_key: client)
+    return completions
+
+
+def ids(result):
+    return [item.item_id for item in result["products"]]
+
+
+# --- _pick_products ---
+def test_pick_products_keeps_ranker_order():
+    result = MercariAgent._pick_products('{"item_ids": ["m3", "m1"]}', ITEMS, 2)
+    assert ids(result) == ["m3", "m1"]
+
+
+def test_pick_products_drops_unknown_ids():
+    result = MercariAgent._pick_products('{"item_ids": ["m9", "m2"]}', ITEMS, 2)
+    assert ids(result) == ["m2"]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        '{"item_ids": ["m9"]}',
+        '{"item_ids": ["m3", "m',
+        None,
+        "",
+        '{"item_ids": "m3"}',
+        "[]",
+    ],
+)
+def test_pick_products_falls_back_to_search_order(message):
+    assert ids(MercariAgent._pick_products(message, ITEMS, 2)) == ["m1", "m2"]
+
+
+# --- recommend_products caching ---
+def test_valid_ranking_is_cached(agent, monkeypatch):
+    completions = use_replies(monkeypatch, [('{"item_ids": ["m2"]}', "stop")])
+    first = asyncio.run(agent.recommend_products("iphone", ITEMS, "nano", 1))
+    second = asyncio.run(agent.recommend_products("iphone", ITEMS, "nano", 1))
+    assert ids(first) == ids(second) == ["m2"]
+    assert completions.calls == 1
+
+
+@pytest.mark.parametrize(
+    "reply", [('{"item_ids": ["m2", "m', "length"), (None, "content_filter")]
+)
+def test_broken_ranking_is_not_cached(agent, monkeypatch, reply):
+    completions = use_replies(monkeypatch, [reply, ('{"item_ids": ["m2"]}', "stop")])
+    first = asyncio.run(agent.recommend_products("iphone", ITEMS, "nano", 1))
+    second = asyncio.run(agent.recommend_products("iphone", ITEMS, "nano", 1))
+    assert ids(first) == ["m1"]
+    assert ids(second) == ["m2"]
+    assert completions.calls == 2
+
+
+# --- embedding rerank ---
+def test_rerank_survives_concurrent_lru_eviction(agent, monkeypatch):
+    agent.cache = None
+    names = [f"item {i}" for i in range(12)]
+    items = [
+        MercariItem(name=n, price="¥1", item_id=f"m{i}") for i, n in enumerate(names)
+    ]
+    # half the names are already embedded, the rest need an API call
+    for i, name in enumerate(names[:6]):
+        agent._name_embeddings[name] = [1.0, 0.0] if i == 4 else [0.0, 1.0]
+
+    async def create(model, input):
+        # another request trims the LRU while this one waits for the API
+        agent._name_embeddings.clear()
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=[0.0, 1.0]) for _ in input]
+        )
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    monkeypatch.setattr(mercari, "get_client", lambda api_key: client)
+    state = mercari.AgentState(query_embedding=[1.0, 0.0])
+    top = asyncio.run(agent._rerank("knife", items, 1, state))
+    assert [item.item_id for item in top] == ["m4"]
+    assert set(agent._name_embeddings) == set(names)
+
+
+# --- recommend_products_batch ---
+def completion(content, finish_reason="stop") -> dict:
+    return {
+        "id": "chat",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4.1-nano",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": finish_reason,
+                "message": {"role": "assistant", "content": content},
+            }
+        ],
+    }
+
+
+def test_batch_ranks_and_caches_valid_replies(agent, monkeypatch):
+    submitted = []
+
+    async def run_batch(endpoint, bodies, poll_interval):
+        submitted.append((endpoint, dict(bodies)))
+        # rank-2 failed inside the batch
+        return {
+            "rank-0": completion('{"item_ids": ["m2"]}'),
+            "rank-1": completion('{"item_ids": ["m3", "m', "length"),
+        }
+
+    monkeypatch.setattr(agent, "_run_batch", run_batch)
+    completions = use_replies(monkeypatch, [('{"item_ids": ["m3"]}', "stop")])
+    inputs = [("iphone", ITEMS), ("case", ITEMS), ("cheap", ITEMS)]
+    results = asyncio.run(agent.recommend_products_batch(inputs, "nano", 1))
+
+    ((endpoint, bodies),) = submitted
+    assert endpoint == "/v1/chat/completions"
+    assert list(bodies) == ["rank-0", "rank-1", "rank-2"]
+    # the cut off reply falls back to search order, the failed request is ranked live
+    assert [ids(result) for result in results] == [["m2"], ["m1"], ["m3"]]
+    assert completions.calls == 1
+
+    # only the complete rankings were cached
+    cache = agent.cache
+    assert cache.get_completion(agent._chat_key(bodies["rank-0"])) is not None
+    assert cache.get_completion(agent._chat_key(bodies["rank-1"])) is None
+    assert cache.get_completion(agent._chat_key(bodies["rank-2"])) is not None
+
+
+def test_batch_skips_cached_rankings(agent, monkeypatch):
+    use_replies(monkeypatch, [('{"item_ids": ["m2"]}', "stop")])
+    asyncio.run(agent.recommend_products("iphone", ITEMS, "nano", 1))
+
+    async def run_batch(endpoint, bodies, poll_interval):
+        assert bodies == {}
+        return {}
+
+    monkeypatch.setattr(agent, "_run_batch", run_batch)
+    results = asyncio.run(
+        agent.recommend_products_batch([("iphone", ITEMS)], "nano", 1)
+    )
+    assert [ids(result) for result in results] == [["m2"]]
@@ -0,0 +1,326 @@
+import asyncio
+import urllib.parse
+from types import SimpleNamespace
+
+import pytest
+
+import src.scraper.mercari_scraper as scraper
+
+
+# --- WebDriverPool ---
+class FakeService:
+    def __init__(self):
+        self.path = None
+        self.path_at_start = None
+        self.service_url = "http://localhost:9515"
+
+    def env_path(self):
+        return None
+
+    def start(self):
+        if self.path is None:
+            raise RuntimeError("Service path cannot be None")
+        self.path_at_start = self.path
+
+    def stop(self):
+        pass
+
+
+class FakeDriver:
+    def execute(self, command, params):
+        pass
+
+    def set_page_load_timeout(self, timeout):
+        pass
+
+
+def test_pool_resolves_driver_path_before_starting_service(monkeypatch):
+    service = FakeService()
+    finder = SimpleNamespace(
+        get_browser_path=lambda: "/usr/bin/chrome",
+        get_driver_path=lambda: "/usr/bin/chromedriver",
+    )
+    monkeypatch.setattr(scraper, "Service", lambda: service)
+    monkeypatch.setattr(scraper, "DriverFinder", lambda service, options: finder)
+    monkeypatch.setattr(scraper, "ChromeRemoteConnection", lambda url: url)
+    monkeypatch.setattr(scraper.webdriver, "Remote", lambda **kwargs: FakeDriver())
+    monkeypatch.setattr(scraper._CHROME_OPTIONS, "binary_location", "")
+
+    pool = scraper.WebDriverPool(1)
+    assert isinstance(pool._new_driver(), FakeDriver)
+    assert service.path_at_start == "/usr/bin/chromedriver"
+    assert scraper._CHROME_OPTIONS.binary_location == "/usr/bin/chrome"
+
+
+# --- API / Selenium switch ---
+def test_use_selenium_is_read_at_call_time(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scraper, "search_items", lambda *args: calls.append("api"))
+    monkeypatch.setattr(
+        scraper,
+        "_search_mercari_selenium",
+        lambda filters, limit: calls.append("selenium") or [],
+    )
+    monkeypatch.setenv("MERCARI_USE_SELENIUM", "1")
+    scraper._search_mercari({"keyword": "knife"}, 5)
+    assert calls == ["selenium"]
+
+
+# --- search cache ---
+def test_empty_search_results_are_not_cached(monkeypatch):
+    calls = []
+
+    def search(filters, limit):
+        calls.append(filters)
+        return []
+
+    monkeypatch.setattr(scraper, "_search_mercari", search)
+    scraper.search_mercari.cache_clear()
+    scraper.search_mercari({"keyword": "knife"})
+    scraper.search_mercari({"keyword": "knife"})
+    assert len(calls) == 2
+
+
+def test_search_results_are_cached(monkeypatch):
+    calls = []
+    item = scraper.MercariItem(name="Knife", price="¥1,000", item_id="m1")
+
+    def search(filters, limit):
+        calls.append(filters)
+        return [item]
+
+    monkeypatch.setattr(scraper, "_search_mercari", search)
+    scraper.search_mercari.cache_clear()
+    assert scraper.search_mercari({"keyword": "knife"}) == [item]
+    assert scraper.search_mercari("knife") == [item]
+    assert len(calls) == 1
+
+
+def test_concurrent_searches_are_coalesced(monkeypatch):
+    calls = []
+    item = scraper.MercariItem(name="Knife", price="¥1,000", item_id="m1")
+
+    async def search(filters, limit):
+        calls.append(filters)
+        await asyncio.sleep(0.01)
+        return [item]
+
+    async def main():
+        return await asyncio.gather(
+            *[scraper.search_mercari_async({"keyword": "knife"}) for _ in range(5)]
+        )
+
+    monkeypatch.setattr(scraper, "_search_mercari_async", search)
+    scraper.search_mercari.cache_clear()
+    assert asyncio.run(main()) == [[item]] * 5
+    assert len(calls) == 1
+
+
+# --- search URL and API condition ---
+def urlencode_search_url(filters: dict) -> str:
+    """
+    The original urlencode-based build_search_url, as the reference output.
+    """
+    sort_map = {
+        "SORT_CREATED_TIME": "created_time",
+        "SORT_SCORE": "score",
+        "SORT_PRICE": "price",
+        "SORT_NUM_LIKES": "num_likes",
+    }
+    order_map = {"ORDER_DESC": "desc", "ORDER_ASC": "asc"}
+    params = {}
+    if filters.get("keyword"):
+        params["keyword"] = filters["keyword"]
+    if filters.get("categoryId"):
+        params["category_id"] = filters["categoryId"][0]
+    if filters.get("priceMin"):
+        params["price_min"] = str(filters["priceMin"])
+    if filters.get("priceMax"):
+        params["price_max"] = str(filters["priceMax"])
+    if filters.get("itemConditionId"):
+        params["item_condition_id"] = ",".join(map(str, filters["itemConditionId"]))
+    if sort_map.get(filters.get("sort")):
+        params["sort"] = sort_map[filters["sort"]]
+    if order_map.get(filters.get("order")):
+        params["order"] = order_map[filters["order"]]
+    query = urllib.parse.urlencode(params, doseq=True)
+    return f"https://jp.mercari.com/search?{query}"
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"keyword": "knife"},
+        {"keyword": "iPhone 13 ケース & cover/+"},
+        {
+            "keyword": "iPhone",
+            "categoryId": ["7"],
+            "priceMin": 100,
+            "priceMax": 15000,
+            "itemConditionId": ["1", "2"],
+            "sort": "SORT_PRICE",
+            "order": "ORDER_ASC",
+        },
+        {"keyword": "x", "sort": "SORT_UNKNOWN", "order": "", "priceMin": 0},
+    ],
+)
+def test_build_search_url_matches_urlencode(filters):
+    assert scraper.build_search_url(filters) == urlencode_search_url(filters)
+
+
+def test_build_search_condition_converts_ids_and_drops_unknown_keys():
+    condition = scraper.build_search_condition(
+        {"keyword": "knife", "itemConditionId": ["1", "3"], "top_k": 3}
+    )
+    assert condition["keyword"] == "knife"
+    assert condition["itemConditionId"] == [1, 3]
+    assert condition["categoryId"] == []
+    assert "top_k" not in condition
+    assert list(condition) == [f.name for f in scraper.fields(scraper.MercariFilter)]
+
+
+# --- keyword shorthand ---
+def test_search_mercari_accepts_a_keyword(monkeypatch):
+    calls = []
+    item = scraper.MercariItem(name="Knife", price="¥1,000", item_id="m1")
+
+    def search(filters, limit):
+        calls.append((filters, limit))
+        return [item]
+
+    monkeypatch.setattr(scraper, "_search_mercari", search)
+    scraper.search_mercari.cache_clear()
+    assert scraper.search_mercari("knife", limit=5) == [item]
+    assert calls == [({"keyword": "knife"}, 5)]
+
+
+def test_search_mercari_async_accepts_a_keyword(monkeypatch):
+    calls = []
+    item = scraper.MercariItem(name="Knife", price="¥1,000", item_id="m1")
+
+    async def search(filters, limit):
+        calls.append((filters, limit))
+        return [item]
+
+    monkeypatch.setattr(scraper, "_search_mercari_async", search)
+    scraper.search_mercari.cache_clear()
+    assert asyncio.run(scraper.search_mercari_async("knife")) == [item]
+    assert calls == [({"keyword": "knife"}, 20)]
+
+
+# --- API result mapping ---
+def test_to_items_maps_search_results():
+    items = scraper._to_items(
+        {"keyword": "knife"},
+        [
+            {
+                "id": "m1",
+                "name": "Knife",
+                "price": "1200",
+                "thumbnails": ["https://static/m1.jpg"],
+                "itemType": "ITEM_TYPE_MERCARI",
+            },
+            {"id": "abc", "itemType": "ITEM_TYPE_BEYOND"},
+        ],
+    )
+    assert items == [
+        scraper.MercariItem(
+            name="Knife",
+            price="¥1,200",
+            image="https://static/m1.jpg",
+            url="https://jp.mercari.com/item/m1",
+            item_id="m1",
+            itemtype="ITEM_TYPE_MERCARI",
+        ),
+        scraper.MercariItem(
+            name="N/A",
+            price="N/A",
+            image=None,
+            url="https://jp.mercari.com/shops/product/abc",
+            item_id="abc",
+            itemtype="ITEM_TYPE_BEYOND",
+        ),
+    ]
+
+
+def test_item_from_api_maps_item_details():
+    item = scraper.MercariItem(
+        name="Knife", price="¥1,200", image="thumb", url="url", item_id="m1"
+    )
+    detail = scraper._item_from_api(
+        item,
+        {
+            "name": "Chef knife",
+            "price": 1200,
+            "description": "Sharp",
+            "item_condition": {"name": "新品、未使用"},
+            "item_category": {
+                "root_category_name": "キッチン",
+                "parent_category_name": None,
+                "name": "包丁",
+            },
+            "photos": ["p1", "p2"],
+            "seller": {"name": "seller", "num_ratings": 0, "star_rating_score": 5},
+        },
+    )
+    assert detail == scraper.MercariItemDetail(
+        name="Chef knife",
+        price="¥1,200",
+        image="thumb",
+        url="url",
+        item_id="m1",
+        description="Sharp",
+        item_condition="新品、未使用",
+        categories=["キッチン", "包丁"],
+        images=["p1", "p2"],
+        seller_name="seller",
+        seller_rating_count="0",
+        seller_rating="5",
+    )
+
+
+def test_item_from_api_tolerates_missing_fields():
+    item = scraper.MercariItem(name="Knife", price="¥1,200", item_id="m1")
+    detail = scraper._item_from_api(item, {})
+    assert detail.price == "N/A"
+    assert detail.categories == []
+    assert detail.images == []
+    assert detail.seller_rating_count is None
+
+
+# --- Selenium search harvest ---
+def link(label, item_id="m1"):
+    return {
+        "href": f"https://jp.mercari.com/item/{item_id}",
+        "label": label,
+        "id": item_id,
+        "itemtype": "ITEM_TYPE_MERCARI",
+        "src": "https://static/thumb.jpg",
+    }
+
+
+@pytest.mark.parametrize(
+    "label, name, price",
+    [
+        ("Chef knife の画像 ¥1,200", "Chef knife", "¥1,200"),
+        ("Knife", "Knife", "N/A"),
+        ("", "N/A", "N/A"),
+        (None, "N/A", "N/A"),
+    ],
+)
+def test_iter_links_parses_thumbnail_labels(label, name, price):
+    (item,) = scraper._iter_links([link(label)])
+    assert (item.name, item.price) == (name, price)
+    assert item.item_id == "m1"
+    assert item.url == "https://jp.mercari.com/item/m1"
+
+
+def test_iter_links_is_lazy():
+    links = iter([link("A の画像 ¥1", "m1"), link("B の画像 ¥2", "m2"), None])
+    items = scraper._iter_links(links)
+    assert next(items).item_id == "m1"
+    assert next(items).item_id == "m2"
+    # the broken third link is only touched when asked for
+    with pytest.raises(TypeError):
+        next(items)